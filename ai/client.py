@@ -1,6 +1,7 @@
 """
 Anthropic Claude API client wrapper.
 """
+import hashlib
 import os
 import json
 import streamlit as st
@@ -60,6 +61,21 @@ def render_api_key_input():
     return True
 
 
+def _get_client(api_key):
+    """This session's Anthropic client, rebuilt when the API key changes.
+
+    Kept in session_state rather than a process-wide resource cache, so one
+    user's key and connections never serve another session. Only a digest
+    of the key is kept next to the client to detect a change.
+    """
+    digest = hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+    cached = st.session_state.get("_anthropic_client")
+    if cached is None or cached[0] != digest:
+        cached = (digest, anthropic.Anthropic(api_key=api_key))
+        st.session_state["_anthropic_client"] = cached
+    return cached[1]
+
+
 def ask_claude(system_prompt, user_message, max_tokens=4096):
     """Send a message to Claude and get a response."""
     if not HAS_ANTHROPIC:
@@ -70,7 +86,7 @@ def ask_claude(system_prompt, user_message, max_tokens=4096):
         return "[IA não configurada - insira sua API Key no sidebar]"
 
     try:
-        client = anthropic.Anthropic(api_key=api_key)
+        client = _get_client(api_key)
         response = client.messages.create(
             model="claude-sonnet-4-20250514",
             max_tokens=max_tokens,
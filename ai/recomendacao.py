@@ -52,9 +52,17 @@ Responda APENAS em JSON com esta estrutura:
 """
 
 
-def generate_recomendacao(prospect_data, carteira_atual, modelo_base, fundos_disponiveis=None):
-    """Generate a personalized portfolio recommendation."""
+def generate_recomendacao(prospect_data, carteira_atual, modelo_base, fundos_disponiveis=None,
+                          failures=None):
+    """Generate a personalized portfolio recommendation.
+
+    If a ``failures`` list is given, "recomendacao" is appended to it when the
+    base-model fallback is returned instead of an AI answer.
+    """
+    if failures is None:
+        failures = []
     if not is_ai_available():
+        failures.append("recomendacao")
         return _fallback_recomendacao(modelo_base, prospect_data)
 
     restricoes = prospect_data.get("restricoes", [])
@@ -99,6 +107,7 @@ Se a carteira atual tem ativos que devem ser mantidos por restricao, incorpore-o
     result = ask_claude_json(SYSTEM_PROMPT, user_msg)
 
     if "error" in result:
+        failures.append("recomendacao")
         return _fallback_recomendacao(modelo_base, prospect_data)
 
     return result
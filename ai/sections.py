@@ -187,13 +187,19 @@ recomendacoes de melhoria. Tom consultivo. Maximo 300 palavras.)
 
 def generate_all_section_texts(prospect, carteira_atual, carteira_proposta,
                                 diagnostico_texto, recomendacao_texto,
-                                analytics_data, modelo_base=None):
+                                analytics_data, modelo_base=None, failures=None):
     """Generate text for all AI-powered proposal sections.
 
     Makes up to 6 batched API calls. Returns dict with section texts.
     Falls back to templates if AI unavailable.
+
+    If a ``failures`` list is given, the name of every batch that fell back to
+    its template or came back empty (AI error) is appended to it.
     """
+    if failures is None:
+        failures = []
     if not is_ai_available():
+        failures.append("all")
         return _generate_fallback_texts(prospect, analytics_data)
 
     results = {}
@@ -203,7 +209,10 @@ def generate_all_section_texts(prospect, carteira_atual, carteira_proposta,
         b1 = _call_batch1(prospect, carteira_atual, carteira_proposta,
                           diagnostico_texto, analytics_data)
         results.update(b1)
+        if not any(b1.values()):
+            failures.append("batch1")
     except Exception:
+        failures.append("batch1")
         results.update(_fallback_batch1(prospect, analytics_data))
 
     # BATCH 2: Portfolio analysis (5, 8)
@@ -211,28 +220,40 @@ def generate_all_section_texts(prospect, carteira_atual, carteira_proposta,
         b2 = _call_batch2(prospect, carteira_atual, carteira_proposta,
                           analytics_data, modelo_base)
         results.update(b2)
+        if not any(b2.values()):
+            failures.append("batch2")
     except Exception:
+        failures.append("batch2")
         results.update(_fallback_batch2(analytics_data))
 
     # BATCH 3: Bottom-up descriptions (9)
     try:
         b3 = _call_batch3(carteira_proposta)
         results.update(b3)
+        if not any(b3.values()):
+            failures.append("batch3")
     except Exception:
+        failures.append("batch3")
         results.update(_fallback_batch3(carteira_proposta))
 
     # BATCH 4: Fund card descriptions
     try:
         b4 = _call_batch4(carteira_proposta)
         results.update(b4)
+        if not any(b4.values()):
+            failures.append("batch4")
     except Exception:
+        failures.append("batch4")
         results.update(_fallback_batch4(carteira_proposta))
 
     # BATCH 5: Investment policy
     try:
         b5 = _call_batch5(prospect, carteira_proposta, analytics_data)
         results.update(b5)
+        if not any(b5.values()):
+            failures.append("batch5")
     except Exception:
+        failures.append("batch5")
         results.update(_fallback_batch5(prospect))
 
     # BATCH 6: Patrimonial analysis (only if family data exists)
@@ -248,7 +269,10 @@ def generate_all_section_texts(prospect, carteira_atual, carteira_proposta,
         try:
             b6 = _call_batch6(prospect)
             results.update(b6)
+            if not any(b6.values()):
+                failures.append("batch6")
         except Exception:
+            failures.append("batch6")
             results.update(_fallback_batch6(prospect))
     else:
         results.update(_fallback_batch6(prospect))
@@ -1,21 +1,147 @@
 """
 SQLite database initialization and connection management.
 """
+import atexit
+import json
 import os
 import sqlite3
+import threading
+import zlib
+
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
 
 DB_PATH = os.path.join(os.path.dirname(__file__), "propostas.db")
 
+# Bulky proposta payloads (backtest/analytics series) are stored as
+# zlib-compressed BLOBs; small ones stay as plain JSON text.
+COMPRESS_MIN_BYTES = 1024
+_ZLIB_MAGIC = b"\x78"  # zlib header byte (CMF for deflate with a 32K window)
+
+
+def json_loads(raw):
+    """Decode a JSON payload (str, bytes or zlib-compressed bytes).
+
+    Uses orjson when available. Invalid payloads raise ValueError, including
+    text that merely starts with "x" and so looks like a zlib header.
+    """
+    if isinstance(raw, bytes) and raw[:1] == _ZLIB_MAGIC:
+        try:
+            raw = zlib.decompress(raw)
+        except zlib.error:
+            pass  # not compressed after all; let the JSON decoder reject it
+    if HAS_ORJSON:
+        try:
+            return orjson.loads(raw)
+        except orjson.JSONDecodeError:
+            pass  # retry with stdlib json, which also accepts NaN/Infinity
+    return json.loads(raw)
+
+
+def json_dumps(obj, default=None):
+    """Encode ``obj`` as a JSON str (UTF-8, non-ASCII kept), using orjson when available.
+
+    ``default`` is called for objects neither encoder handles natively.
+    """
+    if HAS_ORJSON:
+        return orjson.dumps(
+            obj, default=default, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY,
+        ).decode("utf-8")
+    return json.dumps(obj, ensure_ascii=False, default=default)
+
+
+def json_dumps_packed(obj):
+    """Encode ``obj`` as JSON, compressing payloads of COMPRESS_MIN_BYTES or more.
+
+    Returns str for small payloads and zlib-compressed bytes (stored as BLOB)
+    for large ones; json_loads() reads both.
+    """
+    text = json.dumps(obj, ensure_ascii=False)
+    raw = text.encode("utf-8")
+    if len(raw) < COMPRESS_MIN_BYTES:
+        return text
+    return zlib.compress(raw, 6)
+
+
+def _convert_json(raw):
+    """sqlite3 converter for columns declared as JSON.
+
+    Invalid payloads are handed back as text so callers can apply their
+    own per-column fallback ({} or []).
+    """
+    try:
+        return json_loads(raw)
+    except ValueError:
+        return raw.decode("utf-8", "replace")
+
+
+sqlite3.register_converter("JSON", _convert_json)
+# PARSE_DECLTYPES would otherwise turn TIMESTAMP/DATE columns into datetime
+# objects; the pages slice and parse them as ISO strings.
+sqlite3.register_converter("TIMESTAMP", lambda raw: raw.decode("utf-8"))
+sqlite3.register_converter("DATE", lambda raw: raw.decode("utf-8"))
+
+
+# Per-connection settings. WAL lets reads proceed alongside a writer, and
+# with WAL synchronous=NORMAL only fsyncs at checkpoints.
+_CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode=WAL;"
+    "PRAGMA synchronous=NORMAL;"
+    "PRAGMA temp_store=MEMORY;"
+    "PRAGMA mmap_size=268435456;"
+    "PRAGMA foreign_keys=ON;"
+)
+
 
 def get_connection():
     """Get a SQLite connection with row_factory for dict-like access."""
-    conn = sqlite3.connect(DB_PATH)
+    conn = sqlite3.connect(
+        DB_PATH,
+        detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES,
+    )
     conn.row_factory = sqlite3.Row
-    conn.execute("PRAGMA journal_mode=WAL")
-    conn.execute("PRAGMA foreign_keys=ON")
+    conn.executescript(_CONNECTION_PRAGMAS)
+    return conn
+
+
+_thread_local = threading.local()
+
+
+def get_thread_connection():
+    """Get this thread's persistent autocommit connection, opening it on first use.
+
+    For short hot-path queries that would otherwise pay connection setup on
+    every call. Callers must not close it: it is released with its thread
+    (Streamlit runs scripts on short-lived threads), and the main thread's
+    connection is closed at interpreter exit.
+    """
+    conn = getattr(_thread_local, "conn", None)
+    if conn is None or _thread_local.path != DB_PATH:
+        conn = sqlite3.connect(
+            DB_PATH,
+            detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES,
+            check_same_thread=False,
+            isolation_level=None,
+        )
+        conn.row_factory = sqlite3.Row
+        conn.executescript(_CONNECTION_PRAGMAS)
+        _thread_local.conn = conn
+        _thread_local.path = DB_PATH
     return conn
 
 
+def _close_thread_connection():
+    conn = getattr(_thread_local, "conn", None)
+    if conn is not None:
+        conn.close()
+
+
+atexit.register(_close_thread_connection)
+
+
 def init_db():
     """Create tables if they don't exist."""
     conn = get_connection()
@@ -35,10 +161,10 @@ def init_db():
             patrimonio_investivel REAL DEFAULT 0,
             horizonte_investimento TEXT,
 
-            objetivos TEXT DEFAULT '[]',
+            objetivos JSON DEFAULT '[]',
             retirada_mensal REAL DEFAULT 0,
-            eventos_futuros TEXT DEFAULT '[]',
-            restricoes TEXT DEFAULT '[]',
+            eventos_futuros JSON DEFAULT '[]',
+            restricoes JSON DEFAULT '[]',
             restricoes_texto TEXT DEFAULT '',
             observacoes TEXT DEFAULT '',
 
@@ -59,15 +185,15 @@ def init_db():
             versao INTEGER DEFAULT 1,
 
             perfil_modelo TEXT,
-            modelo_dados TEXT,
-            restricoes_aplicadas TEXT DEFAULT '[]',
+            modelo_dados JSON,
+            restricoes_aplicadas JSON DEFAULT '[]',
 
             diagnostico_texto TEXT DEFAULT '',
-            diagnostico_dados TEXT DEFAULT '{}',
+            diagnostico_dados JSON DEFAULT '{}',
             recomendacao_texto TEXT DEFAULT '',
-            carteira_proposta TEXT DEFAULT '[]',
-            plano_transicao TEXT DEFAULT '[]',
-            cenarios TEXT DEFAULT '{}',
+            carteira_proposta JSON DEFAULT '[]',
+            plano_transicao JSON DEFAULT '[]',
+            cenarios JSON DEFAULT '{}',
 
             status TEXT DEFAULT 'Rascunho' CHECK(status IN
                 ('Rascunho', 'Revisão', 'Aprovada', 'Enviada', 'Aceita', 'Rejeitada')),
@@ -92,47 +218,56 @@ def init_db():
         );
 
         CREATE INDEX IF NOT EXISTS idx_prospects_status ON prospects(status);
-        CREATE INDEX IF NOT EXISTS idx_propostas_prospect ON propostas(prospect_id);
+        CREATE INDEX IF NOT EXISTS idx_prospects_updated ON prospects(updated_at DESC);
+        CREATE INDEX IF NOT EXISTS idx_prospects_responsavel ON prospects(responsavel);
+        CREATE INDEX IF NOT EXISTS idx_propostas_updated ON propostas(updated_at DESC);
+        -- (prospect_id, versao DESC) subsumes the old single-column prospect_id index
+        CREATE INDEX IF NOT EXISTS idx_propostas_prospect_versao ON propostas(prospect_id, versao DESC);
+        DROP INDEX IF EXISTS idx_propostas_prospect;
+        CREATE INDEX IF NOT EXISTS idx_propostas_link ON propostas(link_compartilhamento);
         CREATE INDEX IF NOT EXISTS idx_interacoes_prospect ON interacoes(prospect_id);
     """)
 
     # Migration: add new columns for 15-section proposal
     _new_columns_propostas = [
-        ("analytics_data", "TEXT DEFAULT '{}'"),
-        ("section_texts", "TEXT DEFAULT '{}'"),
-        ("backtest_data", "TEXT DEFAULT '{}'"),
-        ("bottom_up_classification", "TEXT DEFAULT '[]'"),
+        ("analytics_data", "JSON DEFAULT '{}'"),
+        ("section_texts", "JSON DEFAULT '{}'"),
+        ("backtest_data", "JSON DEFAULT '{}'"),
+        ("bottom_up_classification", "JSON DEFAULT '[]'"),
         # Sprint 1: columns for full PPTX-style proposals
-        ("politica_investimentos", "TEXT DEFAULT '{}'"),
-        ("fundos_sugeridos", "TEXT DEFAULT '[]'"),
-        ("proposta_comercial", "TEXT DEFAULT '{}'"),
+        ("politica_investimentos", "JSON DEFAULT '{}'"),
+        ("fundos_sugeridos", "JSON DEFAULT '[]'"),
+        ("proposta_comercial", "JSON DEFAULT '{}'"),
     ]
-    for col_name, col_def in _new_columns_propostas:
-        try:
-            cursor.execute(f"ALTER TABLE propostas ADD COLUMN {col_name} {col_def}")
-        except Exception:
-            pass  # Column already exists
-
     # Migration: add new columns for prospect (family, patrimony, fees)
     _new_columns_prospects = [
-        ("estrutura_familiar", "TEXT DEFAULT '[]'"),
-        ("estrutura_patrimonial", "TEXT DEFAULT '{}'"),
-        ("plano_sucessorio", "TEXT DEFAULT '{}'"),
-        ("fee_negociada", "TEXT DEFAULT '{}'"),
+        ("estrutura_familiar", "JSON DEFAULT '[]'"),
+        ("estrutura_patrimonial", "JSON DEFAULT '{}'"),
+        ("plano_sucessorio", "JSON DEFAULT '{}'"),
+        ("fee_negociada", "JSON DEFAULT '{}'"),
     ]
-    for col_name, col_def in _new_columns_prospects:
-        try:
-            cursor.execute(f"ALTER TABLE prospects ADD COLUMN {col_name} {col_def}")
-        except Exception:
-            pass  # Column already exists
+    # Only the missing columns are added, all in a single executescript batch
+    migrations = []
+    for table, new_columns in (("propostas", _new_columns_propostas),
+                               ("prospects", _new_columns_prospects)):
+        existing = {r[1] for r in cursor.execute(f"PRAGMA table_info({table})")}
+        migrations.extend(
+            f"ALTER TABLE {table} ADD COLUMN {col_name} {col_def};"
+            for col_name, col_def in new_columns
+            if col_name not in existing
+        )
+    if migrations:
+        cursor.executescript("\n".join(migrations))
 
     # ── Premissas table for planning/financial settings ──
+    # UNIQUE(tipo) already creates the index behind the WHERE tipo = ?
+    # lookups and upsert_premissa's ON CONFLICT(tipo); no extra index needed.
     cursor.execute("""
         CREATE TABLE IF NOT EXISTS premissas (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             tipo TEXT NOT NULL UNIQUE,
             dados TEXT NOT NULL DEFAULT '{}',
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            updated_at TIMESTAMP DEFAULT (strftime('%Y-%m-%dT%H:%M:%f', 'now', 'localtime'))
         )
     """)
 
@@ -2,29 +2,116 @@
 CRUD operations for prospects, propostas, and interações.
 """
 import json
-import uuid
+import secrets
+import time
 from datetime import datetime
 
-from database.db import get_connection
+from database.db import get_connection, json_dumps_packed, json_loads
+
+# get_pipeline_stats() is rendered on every dashboard rerun; keep the last
+# result for a short TTL and drop it whenever a write touches the pipeline.
+_PIPELINE_STATS_TTL = 30  # seconds
+_pipeline_stats_cache = {}
+
+
+def _invalidate_pipeline_stats():
+    _pipeline_stats_cache.clear()
+
+
+def _encode_json(val):
+    """Serialize list/dict values for a JSON column; other values pass through."""
+    if isinstance(val, (list, dict)):
+        return json.dumps(val, ensure_ascii=False)
+    return val
+
+
+def _loads_or(val, default):
+    """Decode a JSON payload left undecoded by the driver, or return ``default``."""
+    try:
+        return json_loads(val)
+    except ValueError:
+        return default
+
+
+def _encode_json_packed(val):
+    """Like _encode_json, but large payloads are stored compressed."""
+    if isinstance(val, (list, dict)):
+        return json_dumps_packed(val)
+    return val
+
+
+def _set_clause(data, writers, readonly):
+    """Build the SET clause and its values for an UPDATE from ``data``.
+
+    ``writers`` maps column -> encoder for columns that need one; ``readonly``
+    holds keys that are never written. ``updated_at`` is always refreshed.
+    """
+    assignments = []
+    values = []
+    for key, val in data.items():
+        if key in readonly:
+            continue
+        writer = writers.get(key)
+        assignments.append(key + " = ?")
+        values.append(writer(val) if writer else val)
+    assignments.append("updated_at = ?")
+    values.append(datetime.now().isoformat())
+    return ", ".join(assignments), values
 
 
 # ─────────────────────────────────────────────────────────
 # PROSPECTS
 # ─────────────────────────────────────────────────────────
 
-def create_prospect(data):
-    """Create a new prospect. Returns the new ID."""
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        """INSERT INTO prospects
+_INSERT_PROSPECT = """INSERT INTO prospects
         (nome, cpf_cnpj, email, telefone, tipo_pessoa,
          perfil_investidor, patrimonio_total, patrimonio_investivel,
          horizonte_investimento, objetivos, retirada_mensal,
          eventos_futuros, restricoes, restricoes_texto, observacoes,
          status, responsavel,
          estrutura_familiar, estrutura_patrimonial, plano_sucessorio, fee_negociada)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"""
+_SELECT_PROSPECT = "SELECT * FROM prospects WHERE id = ?"
+_DELETE_PROSPECT = "DELETE FROM prospects WHERE id = ?"
+
+_PROSPECT_WRITERS = {
+    col: _encode_json for col in (
+        "objetivos", "eventos_futuros", "restricoes",
+        "estrutura_familiar", "estrutura_patrimonial", "plano_sucessorio", "fee_negociada",
+    )
+}
+_PROSPECT_READONLY = frozenset(("id", "created_at"))
+
+_PROSPECT_JSON_LIST = frozenset(("objetivos", "eventos_futuros", "restricoes", "estrutura_familiar"))
+_PROSPECT_JSON_DICT = frozenset(("estrutura_patrimonial", "plano_sucessorio", "fee_negociada"))
+_FETCH_BATCH = 256
+
+
+def _decode_prospect_row(row):
+    """Convert a prospects row into a dict with its JSON columns decoded.
+
+    JSON columns come back decoded by the driver; only legacy TEXT-declared
+    columns and invalid payloads still arrive as strings. Rows selected with
+    a subset of columns only decode the columns present.
+    """
+    d = dict(row)
+    for key in _PROSPECT_JSON_LIST:
+        val = d.get(key)
+        if val and isinstance(val, str):
+            d[key] = _loads_or(val, [])
+    for key in _PROSPECT_JSON_DICT:
+        val = d.get(key)
+        if val and isinstance(val, str):
+            d[key] = _loads_or(val, {})
+    return d
+
+
+def create_prospect(data):
+    """Create a new prospect. Returns the new ID."""
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute(
+        _INSERT_PROSPECT,
         (
             data.get("nome", ""),
             data.get("cpf_cnpj", ""),
@@ -52,66 +139,54 @@ def create_prospect(data):
     prospect_id = cursor.lastrowid
     conn.commit()
     conn.close()
+    _invalidate_pipeline_stats()
     return prospect_id
 
 
 def update_prospect(prospect_id, data):
     """Update an existing prospect."""
-    conn = get_connection()
-    fields = []
-    values = []
-    _prospect_json_fields = {
-        "objetivos", "eventos_futuros", "restricoes",
-        "estrutura_familiar", "estrutura_patrimonial", "plano_sucessorio", "fee_negociada",
-    }
-    for key, val in data.items():
-        if key in ("id", "created_at"):
-            continue
-        if key in _prospect_json_fields and isinstance(val, (list, dict)):
-            val = json.dumps(val, ensure_ascii=False)
-        fields.append(f"{key} = ?")
-        values.append(val)
-    fields.append("updated_at = ?")
-    values.append(datetime.now().isoformat())
+    set_clause, values = _set_clause(data, _PROSPECT_WRITERS, _PROSPECT_READONLY)
     values.append(prospect_id)
 
-    conn.execute(
-        f"UPDATE prospects SET {', '.join(fields)} WHERE id = ?",
-        values,
-    )
+    conn = get_connection()
+    conn.execute(f"UPDATE prospects SET {set_clause} WHERE id = ?", values)
     conn.commit()
     conn.close()
+    _invalidate_pipeline_stats()
+
+
+def upsert_prospect(data, prospect_id=None):
+    """Create or update a prospect. Returns its ID.
+
+    With ``prospect_id`` None a new row is created from ``data``
+    (create_prospect); otherwise only the columns present in ``data`` are
+    updated (update_prospect), so callers may pass just the fields that changed.
+    """
+    if prospect_id is None:
+        return create_prospect(data)
+    update_prospect(prospect_id, data)
+    return prospect_id
 
 
 def get_prospect(prospect_id):
     """Get a single prospect by ID. Returns dict or None."""
     conn = get_connection()
-    row = conn.execute("SELECT * FROM prospects WHERE id = ?", (prospect_id,)).fetchone()
+    row = conn.execute(_SELECT_PROSPECT, (prospect_id,)).fetchone()
     conn.close()
     if row is None:
         return None
-    d = dict(row)
-    _list_fields = ("objetivos", "eventos_futuros", "restricoes", "estrutura_familiar")
-    _dict_fields = ("estrutura_patrimonial", "plano_sucessorio", "fee_negociada")
-    for key in _list_fields:
-        if d.get(key):
-            try:
-                d[key] = json.loads(d[key])
-            except (json.JSONDecodeError, TypeError):
-                d[key] = []
-    for key in _dict_fields:
-        if d.get(key):
-            try:
-                d[key] = json.loads(d[key])
-            except (json.JSONDecodeError, TypeError):
-                d[key] = {}
-    return d
+    return _decode_prospect_row(row)
 
 
-def list_prospects(status=None, responsavel=None, search=None):
-    """List prospects with optional filters."""
-    conn = get_connection()
-    query = "SELECT * FROM prospects WHERE 1=1"
+def iter_prospects(status=None, responsavel=None, search=None, columns=None):
+    """Yield prospects with optional filters, fetching rows in batches.
+
+    Only one batch of rows is held in memory at a time, which suits exports and
+    paginated views. ``columns`` restricts the SELECT to the given column names
+    so list views don't fetch and decode JSON blobs they never render.
+    """
+    select = ", ".join(columns) if columns else "*"
+    query = f"SELECT {select} FROM prospects WHERE 1=1"
     params = []
 
     if status:
@@ -126,207 +201,203 @@ def list_prospects(status=None, responsavel=None, search=None):
         params.extend([s, s, s])
 
     query += " ORDER BY updated_at DESC"
-    rows = conn.execute(query, params).fetchall()
+    conn = get_connection()
+    try:
+        cursor = conn.execute(query, params)
+        while True:
+            batch = cursor.fetchmany(_FETCH_BATCH)
+            if not batch:
+                break
+            for row in batch:
+                yield _decode_prospect_row(row)
+    finally:
+        conn.close()
+
+
+def list_prospects(status=None, responsavel=None, search=None, columns=None):
+    """List prospects with optional filters (see iter_prospects)."""
+    return list(iter_prospects(status, responsavel, search, columns))
+
+
+_PROSPECTS_FINGERPRINT = "SELECT COUNT(*), MAX(id), MAX(updated_at) FROM prospects"
+
+
+def prospects_fingerprint():
+    """(row count, highest id, latest updated_at) of the prospects table.
+
+    Changes on every insert, update or delete from any session or process, so
+    it can key caches of prospect lists. Ids are AUTOINCREMENT and never
+    reused, so MAX(id) catches inserts even when the new row's default
+    CURRENT_TIMESTAMP sorts below the ISO updated_at values written by
+    updates.
+    """
+    conn = get_connection()
+    row = conn.execute(_PROSPECTS_FINGERPRINT).fetchone()
     conn.close()
-    results = []
-    for row in rows:
-        d = dict(row)
-        for key in ("objetivos", "eventos_futuros", "restricoes", "estrutura_familiar"):
-            if d.get(key):
-                try:
-                    d[key] = json.loads(d[key])
-                except (json.JSONDecodeError, TypeError):
-                    d[key] = []
-        for key in ("estrutura_patrimonial", "plano_sucessorio", "fee_negociada"):
-            if d.get(key):
-                try:
-                    d[key] = json.loads(d[key])
-                except (json.JSONDecodeError, TypeError):
-                    d[key] = {}
-        results.append(d)
-    return results
+    return tuple(row)
 
 
 def delete_prospect(prospect_id):
     """Delete a prospect and all related data."""
     conn = get_connection()
-    conn.execute("DELETE FROM prospects WHERE id = ?", (prospect_id,))
+    conn.execute(_DELETE_PROSPECT, (prospect_id,))
     conn.commit()
     conn.close()
+    _invalidate_pipeline_stats()
 
 
 # ─────────────────────────────────────────────────────────
 # PROPOSTAS
 # ─────────────────────────────────────────────────────────
 
+_INSERT_PROPOSTA = """INSERT INTO propostas
+        (prospect_id, versao, perfil_modelo, modelo_dados,
+         restricoes_aplicadas, diagnostico_texto, diagnostico_dados,
+         recomendacao_texto, carteira_proposta, plano_transicao,
+         cenarios, status, link_compartilhamento,
+         analytics_data, section_texts, backtest_data, bottom_up_classification,
+         politica_investimentos, fundos_sugeridos, proposta_comercial)
+        VALUES (?, (SELECT COALESCE(MAX(versao), 0) + 1 FROM propostas WHERE prospect_id = ?),
+                ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"""
+_SELECT_PROPOSTA = "SELECT * FROM propostas WHERE id = ?"
+_SELECT_PROPOSTA_BY_LINK = "SELECT * FROM propostas WHERE link_compartilhamento = ?"
+
+_PROPOSTA_DICT_DEFAULTS = frozenset((
+    "diagnostico_dados", "cenarios", "analytics_data", "section_texts", "backtest_data",
+    "politica_investimentos", "proposta_comercial",
+))
+_PROPOSTA_JSON_FIELDS = _PROPOSTA_DICT_DEFAULTS | frozenset((
+    "modelo_dados", "restricoes_aplicadas", "carteira_proposta", "plano_transicao",
+    "bottom_up_classification", "fundos_sugeridos",
+))
+_PROPOSTA_WRITERS = {col: _encode_json_packed for col in _PROPOSTA_JSON_FIELDS}
+_PROPOSTA_READONLY = frozenset(("id", "created_at", "prospect_id"))
+
+
+def _decode_proposta_row(row):
+    """Convert a propostas row into a dict with its JSON columns decoded.
+
+    The driver already decodes JSON-declared columns; str/bytes values that
+    remain come from legacy TEXT-declared columns (compressed payloads arrive
+    as bytes there) or invalid payloads. Rows selected with a subset of
+    columns only decode the columns present.
+    """
+    d = dict(row)
+    for key in _PROPOSTA_JSON_FIELDS:
+        val = d.get(key)
+        if val and isinstance(val, (str, bytes)):
+            d[key] = _loads_or(val, {} if key in _PROPOSTA_DICT_DEFAULTS else [])
+    return d
+
+
 def create_proposta(prospect_id, data=None):
     """Create a new proposta for a prospect. Returns the new ID."""
     if data is None:
         data = {}
     conn = get_connection()
 
-    # Get next version number
-    row = conn.execute(
-        "SELECT COALESCE(MAX(versao), 0) + 1 as next_v FROM propostas WHERE prospect_id = ?",
-        (prospect_id,),
-    ).fetchone()
-    next_version = row["next_v"]
-
-    link_id = str(uuid.uuid4())[:8]
+    link_id = secrets.token_urlsafe(6)
 
     cursor = conn.cursor()
     cursor.execute(
-        """INSERT INTO propostas
-        (prospect_id, versao, perfil_modelo, modelo_dados,
-         restricoes_aplicadas, diagnostico_texto, diagnostico_dados,
-         recomendacao_texto, carteira_proposta, plano_transicao,
-         cenarios, status, link_compartilhamento,
-         analytics_data, section_texts, backtest_data, bottom_up_classification,
-         politica_investimentos, fundos_sugeridos, proposta_comercial)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+        _INSERT_PROPOSTA,
         (
             prospect_id,
-            next_version,
+            prospect_id,  # next version number, computed inside the INSERT
             data.get("perfil_modelo", ""),
-            json.dumps(data.get("modelo_dados", []), ensure_ascii=False),
-            json.dumps(data.get("restricoes_aplicadas", []), ensure_ascii=False),
+            json_dumps_packed(data.get("modelo_dados", [])),
+            json_dumps_packed(data.get("restricoes_aplicadas", [])),
             data.get("diagnostico_texto", ""),
-            json.dumps(data.get("diagnostico_dados", {}), ensure_ascii=False),
+            json_dumps_packed(data.get("diagnostico_dados", {})),
             data.get("recomendacao_texto", ""),
-            json.dumps(data.get("carteira_proposta", []), ensure_ascii=False),
-            json.dumps(data.get("plano_transicao", []), ensure_ascii=False),
-            json.dumps(data.get("cenarios", {}), ensure_ascii=False),
+            json_dumps_packed(data.get("carteira_proposta", [])),
+            json_dumps_packed(data.get("plano_transicao", [])),
+            json_dumps_packed(data.get("cenarios", {})),
             data.get("status", "Rascunho"),
             link_id,
-            json.dumps(data.get("analytics_data", {}), ensure_ascii=False),
-            json.dumps(data.get("section_texts", {}), ensure_ascii=False),
-            json.dumps(data.get("backtest_data", {}), ensure_ascii=False),
-            json.dumps(data.get("bottom_up_classification", []), ensure_ascii=False),
-            json.dumps(data.get("politica_investimentos", {}), ensure_ascii=False),
-            json.dumps(data.get("fundos_sugeridos", []), ensure_ascii=False),
-            json.dumps(data.get("proposta_comercial", {}), ensure_ascii=False),
+            json_dumps_packed(data.get("analytics_data", {})),
+            json_dumps_packed(data.get("section_texts", {})),
+            json_dumps_packed(data.get("backtest_data", {})),
+            json_dumps_packed(data.get("bottom_up_classification", [])),
+            json_dumps_packed(data.get("politica_investimentos", {})),
+            json_dumps_packed(data.get("fundos_sugeridos", [])),
+            json_dumps_packed(data.get("proposta_comercial", {})),
         ),
     )
     proposta_id = cursor.lastrowid
     conn.commit()
     conn.close()
+    _invalidate_pipeline_stats()
     return proposta_id
 
 
 def update_proposta(proposta_id, data):
     """Update an existing proposta."""
-    conn = get_connection()
-    fields = []
-    values = []
-    json_fields = {
-        "modelo_dados", "restricoes_aplicadas", "diagnostico_dados",
-        "carteira_proposta", "plano_transicao", "cenarios",
-        "analytics_data", "section_texts", "backtest_data",
-        "bottom_up_classification",
-        "politica_investimentos", "fundos_sugeridos", "proposta_comercial",
-    }
-    for key, val in data.items():
-        if key in ("id", "created_at", "prospect_id"):
-            continue
-        if key in json_fields and isinstance(val, (list, dict)):
-            val = json.dumps(val, ensure_ascii=False)
-        fields.append(f"{key} = ?")
-        values.append(val)
-    fields.append("updated_at = ?")
-    values.append(datetime.now().isoformat())
+    set_clause, values = _set_clause(data, _PROPOSTA_WRITERS, _PROPOSTA_READONLY)
     values.append(proposta_id)
 
-    conn.execute(
-        f"UPDATE propostas SET {', '.join(fields)} WHERE id = ?",
-        values,
-    )
+    conn = get_connection()
+    conn.execute(f"UPDATE propostas SET {set_clause} WHERE id = ?", values)
     conn.commit()
     conn.close()
+    _invalidate_pipeline_stats()
 
 
 def get_proposta(proposta_id):
     """Get a single proposta by ID."""
     conn = get_connection()
-    row = conn.execute("SELECT * FROM propostas WHERE id = ?", (proposta_id,)).fetchone()
+    row = conn.execute(_SELECT_PROPOSTA, (proposta_id,)).fetchone()
     conn.close()
     if row is None:
         return None
-    d = dict(row)
-    json_fields = {
-        "modelo_dados", "restricoes_aplicadas", "diagnostico_dados",
-        "carteira_proposta", "plano_transicao", "cenarios",
-        "analytics_data", "section_texts", "backtest_data",
-        "bottom_up_classification",
-        "politica_investimentos", "fundos_sugeridos", "proposta_comercial",
-    }
-    for key in json_fields:
-        if d.get(key):
-            try:
-                d[key] = json.loads(d[key])
-            except (json.JSONDecodeError, TypeError):
-                _dict_keys = ("diagnostico_dados", "cenarios", "analytics_data",
-                              "section_texts", "backtest_data",
-                              "politica_investimentos", "proposta_comercial")
-                d[key] = {} if key in _dict_keys else []
-    return d
+    return _decode_proposta_row(row)
 
 
 def get_proposta_by_link(link_id):
     """Get a proposta by its shareable link ID."""
     conn = get_connection()
-    row = conn.execute(
-        "SELECT * FROM propostas WHERE link_compartilhamento = ?", (link_id,)
-    ).fetchone()
+    row = conn.execute(_SELECT_PROPOSTA_BY_LINK, (link_id,)).fetchone()
     conn.close()
     if row is None:
         return None
-    d = dict(row)
-    json_fields = {
-        "modelo_dados", "restricoes_aplicadas", "diagnostico_dados",
-        "carteira_proposta", "plano_transicao", "cenarios",
-        "analytics_data", "section_texts", "backtest_data",
-        "bottom_up_classification",
-        "politica_investimentos", "fundos_sugeridos", "proposta_comercial",
-    }
-    for key in json_fields:
-        if d.get(key):
-            try:
-                d[key] = json.loads(d[key])
-            except (json.JSONDecodeError, TypeError):
-                _dict_keys = ("diagnostico_dados", "cenarios", "analytics_data",
-                              "section_texts", "backtest_data",
-                              "politica_investimentos", "proposta_comercial")
-                d[key] = {} if key in _dict_keys else []
-    return d
+    return _decode_proposta_row(row)
 
 
-def list_propostas(prospect_id=None):
-    """List propostas, optionally filtered by prospect."""
+def list_propostas(prospect_id=None, columns=None):
+    """List propostas, optionally filtered by prospect.
+
+    ``columns`` restricts the SELECT to the given column names (see list_prospects).
+    """
     conn = get_connection()
+    select = ", ".join(columns) if columns else "*"
     if prospect_id:
         rows = conn.execute(
-            "SELECT * FROM propostas WHERE prospect_id = ? ORDER BY versao DESC",
+            f"SELECT {select} FROM propostas WHERE prospect_id = ? ORDER BY versao DESC",
             (prospect_id,),
         ).fetchall()
     else:
         rows = conn.execute(
-            "SELECT * FROM propostas ORDER BY updated_at DESC"
+            f"SELECT {select} FROM propostas ORDER BY updated_at DESC"
         ).fetchall()
     conn.close()
-    return [dict(r) for r in rows]
+    return [_decode_proposta_row(r) for r in rows]
 
 
 # ─────────────────────────────────────────────────────────
 # INTERAÇÕES
 # ─────────────────────────────────────────────────────────
 
+_INSERT_INTERACAO = """INSERT INTO interacoes
+        (prospect_id, tipo, descricao, responsavel, proxima_acao, data_proxima_acao)
+        VALUES (?, ?, ?, ?, ?, ?)"""
+_LIST_INTERACOES = "SELECT * FROM interacoes WHERE prospect_id = ? ORDER BY created_at DESC"
+
+
 def add_interacao(prospect_id, data):
     """Add a new interaction for a prospect."""
     conn = get_connection()
     conn.execute(
-        """INSERT INTO interacoes
-        (prospect_id, tipo, descricao, responsavel, proxima_acao, data_proxima_acao)
-        VALUES (?, ?, ?, ?, ?, ?)""",
+        _INSERT_INTERACAO,
         (
             prospect_id,
             data.get("tipo", "Outro"),
@@ -338,15 +409,13 @@ def add_interacao(prospect_id, data):
     )
     conn.commit()
     conn.close()
+    _invalidate_pipeline_stats()
 
 
 def list_interacoes(prospect_id):
     """List all interactions for a prospect."""
     conn = get_connection()
-    rows = conn.execute(
-        "SELECT * FROM interacoes WHERE prospect_id = ? ORDER BY created_at DESC",
-        (prospect_id,),
-    ).fetchall()
+    rows = conn.execute(_LIST_INTERACOES, (prospect_id,)).fetchall()
     conn.close()
     return [dict(r) for r in rows]
 
@@ -355,57 +424,79 @@ def list_interacoes(prospect_id):
 # PIPELINE STATS
 # ─────────────────────────────────────────────────────────
 
+# Status counts for prospects ('prospect') and propostas ('proposta') in one pass
+_STATS_BY_STATUS = (
+    "SELECT 'prospect' as k, status, COUNT(*) as cnt, SUM(patrimonio_investivel) as total_pl "
+    "FROM prospects GROUP BY status "
+    "UNION ALL "
+    "SELECT 'proposta' as k, status, COUNT(*) as cnt, NULL as total_pl "
+    "FROM propostas GROUP BY status"
+)
+# Recent interactions ('recent') followed by upcoming actions ('upcoming')
+# The inner ORDER BY only picks each branch's LIMIT rows; the outer one fixes
+# the order the rows come back in, which UNION ALL alone does not guarantee.
+_STATS_INTERACOES = (
+    "SELECT * FROM ("
+    "SELECT * FROM ("
+    "SELECT 'recent' as k, i.*, p.nome as prospect_nome FROM interacoes i "
+    "JOIN prospects p ON i.prospect_id = p.id "
+    "ORDER BY i.created_at DESC LIMIT 10) "
+    "UNION ALL "
+    "SELECT * FROM ("
+    "SELECT 'upcoming' as k, i.*, p.nome as prospect_nome FROM interacoes i "
+    "JOIN prospects p ON i.prospect_id = p.id "
+    "WHERE i.data_proxima_acao >= date('now') AND i.proxima_acao != '' "
+    "ORDER BY i.data_proxima_acao ASC LIMIT 10)"
+    ") ORDER BY k, "
+    "CASE k WHEN 'recent' THEN created_at END DESC, "
+    "CASE k WHEN 'upcoming' THEN data_proxima_acao END ASC"
+)
+_SELECT_RESPONSAVEIS = (
+    "SELECT DISTINCT responsavel FROM prospects WHERE responsavel != '' ORDER BY responsavel"
+)
+
+
 def get_pipeline_stats():
-    """Get pipeline statistics for dashboard."""
-    conn = get_connection()
+    """Get pipeline statistics for dashboard (cached for _PIPELINE_STATS_TTL seconds)."""
+    cached = _pipeline_stats_cache.get("stats")
+    if cached and time.monotonic() - cached[0] < _PIPELINE_STATS_TTL:
+        return cached[1]
 
-    # Count by status
-    rows = conn.execute(
-        "SELECT status, COUNT(*) as cnt, SUM(patrimonio_investivel) as total_pl "
-        "FROM prospects GROUP BY status"
-    ).fetchall()
+    conn = get_connection()
 
     stats = {
-        "by_status": {r["status"]: {"count": r["cnt"], "total_pl": r["total_pl"] or 0} for r in rows},
+        "by_status": {},
         "total": 0,
         "total_pl": 0,
+        "propostas_by_status": {},
+        "recent_interacoes": [],
+        "upcoming_actions": [],
     }
-    for r in rows:
-        stats["total"] += r["cnt"]
-        stats["total_pl"] += r["total_pl"] or 0
-
-    # Count propostas by status
-    rows = conn.execute(
-        "SELECT status, COUNT(*) as cnt FROM propostas GROUP BY status"
-    ).fetchall()
-    stats["propostas_by_status"] = {r["status"]: r["cnt"] for r in rows}
-
-    # Recent interactions
-    rows = conn.execute(
-        "SELECT i.*, p.nome as prospect_nome FROM interacoes i "
-        "JOIN prospects p ON i.prospect_id = p.id "
-        "ORDER BY i.created_at DESC LIMIT 10"
-    ).fetchall()
-    stats["recent_interacoes"] = [dict(r) for r in rows]
-
-    # Upcoming actions
-    rows = conn.execute(
-        "SELECT i.*, p.nome as prospect_nome FROM interacoes i "
-        "JOIN prospects p ON i.prospect_id = p.id "
-        "WHERE i.data_proxima_acao >= date('now') AND i.proxima_acao != '' "
-        "ORDER BY i.data_proxima_acao ASC LIMIT 10"
-    ).fetchall()
-    stats["upcoming_actions"] = [dict(r) for r in rows]
+
+    # Count prospects and propostas by status
+    for r in conn.execute(_STATS_BY_STATUS):
+        if r["k"] == "prospect":
+            total_pl = r["total_pl"] or 0
+            stats["by_status"][r["status"]] = {"count": r["cnt"], "total_pl": total_pl}
+            stats["total"] += r["cnt"]
+            stats["total_pl"] += total_pl
+        else:
+            stats["propostas_by_status"][r["status"]] = r["cnt"]
+
+    # Recent interactions and upcoming actions
+    for r in conn.execute(_STATS_INTERACOES):
+        d = dict(r)
+        key = "recent_interacoes" if d.pop("k") == "recent" else "upcoming_actions"
+        stats[key].append(d)
 
     conn.close()
+    _pipeline_stats_cache["stats"] = (time.monotonic(), stats)
     return stats
 
 
 def get_responsaveis():
     """Get list of unique responsáveis from prospects."""
     conn = get_connection()
-    rows = conn.execute(
-        "SELECT DISTINCT responsavel FROM prospects WHERE responsavel != '' ORDER BY responsavel"
-    ).fetchall()
+    rows = conn.execute(_SELECT_RESPONSAVEIS).fetchall()
     conn.close()
     return [r["responsavel"] for r in rows]
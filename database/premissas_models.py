@@ -1,72 +1,69 @@
 """
 CRUD operations for planning premissas (PGBL, actuarial, succession, macro).
 """
-import json
-from datetime import datetime
+import time
 
-from database.db import get_connection
+from database.db import get_thread_connection, json_dumps, json_loads
+
+_SQL_GET = "SELECT * FROM premissas WHERE tipo = ?"
+# updated_at is stamped by SQLite in the same local ISO format as
+# datetime.now().isoformat() (millisecond precision).
+_SQL_UPSERT = (
+    "INSERT INTO premissas (tipo, dados, updated_at) "
+    "VALUES (?, ?, strftime('%Y-%m-%dT%H:%M:%f', 'now', 'localtime')) "
+    "ON CONFLICT(tipo) DO UPDATE SET dados = excluded.dados, updated_at = excluded.updated_at "
+    "RETURNING id"
+)
+# The whole listing comes back as one JSON array built by SQLite; invalid
+# dados payloads become {} there, like _parse_dados does for single rows.
+_SQL_LIST = (
+    "SELECT json_group_array(json_object("
+    "'id', id, 'tipo', tipo, "
+    "'dados', CASE WHEN json_valid(dados) THEN json(dados) ELSE json('{}') END, "
+    "'updated_at', updated_at)) "
+    "FROM (SELECT * FROM premissas ORDER BY tipo)"
+)
+_SQL_DELETE = "DELETE FROM premissas WHERE tipo = ?"
+
+# Premissas change rarely but are read on many code paths; get_premissa keeps
+# each tipo for _CACHE_TTL seconds, and writes through this module evict it.
+_CACHE_TTL = 60  # seconds
+_CACHE = {}  # tipo -> (monotonic timestamp, premissa dict or None)
+
+
+def _parse_dados(raw):
+    """Decode the dados JSON column, falling back to {} on bad payloads."""
+    try:
+        return json_loads(raw)
+    except (ValueError, TypeError):
+        return {}
 
 
 def get_premissa(tipo):
     """Get premissa data by type. Returns dict or None."""
-    conn = get_connection()
-    row = conn.execute(
-        "SELECT * FROM premissas WHERE tipo = ?", (tipo,)
-    ).fetchone()
-    conn.close()
-    if row is None:
-        return None
-    d = dict(row)
-    try:
-        d["dados"] = json.loads(d["dados"])
-    except (json.JSONDecodeError, TypeError):
-        d["dados"] = {}
+    cached = _CACHE.get(tipo)
+    if cached and time.monotonic() - cached[0] < _CACHE_TTL:
+        return cached[1]
+    row = get_thread_connection().execute(_SQL_GET, (tipo,)).fetchone()
+    d = None
+    if row is not None:
+        d = dict(row)
+        d["dados"] = _parse_dados(d["dados"])
+    _CACHE[tipo] = (time.monotonic(), d)
     return d
 
 
 def upsert_premissa(tipo, dados):
     """Insert or update a premissa. Returns the row id."""
-    conn = get_connection()
-    cursor = conn.cursor()
-    dados_json = json.dumps(dados, ensure_ascii=False)
-    now = datetime.now().isoformat()
-
-    existing = conn.execute(
-        "SELECT id FROM premissas WHERE tipo = ?", (tipo,)
-    ).fetchone()
-
-    if existing:
-        cursor.execute(
-            "UPDATE premissas SET dados = ?, updated_at = ? WHERE tipo = ?",
-            (dados_json, now, tipo),
-        )
-        row_id = existing["id"]
-    else:
-        cursor.execute(
-            "INSERT INTO premissas (tipo, dados, updated_at) VALUES (?, ?, ?)",
-            (tipo, dados_json, now),
-        )
-        row_id = cursor.lastrowid
-
-    conn.commit()
-    conn.close()
-    return row_id
+    rows = get_thread_connection().execute(_SQL_UPSERT, (tipo, json_dumps(dados))).fetchall()
+    _CACHE.pop(tipo, None)
+    return rows[0]["id"]
 
 
 def list_premissas():
     """List all premissas. Returns list of dicts."""
-    conn = get_connection()
-    rows = conn.execute("SELECT * FROM premissas ORDER BY tipo").fetchall()
-    conn.close()
-    results = []
-    for row in rows:
-        d = dict(row)
-        try:
-            d["dados"] = json.loads(d["dados"])
-        except (json.JSONDecodeError, TypeError):
-            d["dados"] = {}
-        results.append(d)
-    return results
+    (payload,) = get_thread_connection().execute(_SQL_LIST).fetchone()
+    return json_loads(payload)
 
 
 def get_premissa_or_default(tipo, defaults):
@@ -79,7 +76,5 @@ def get_premissa_or_default(tipo, defaults):
 
 def delete_premissa(tipo):
     """Delete a premissa by type."""
-    conn = get_connection()
-    conn.execute("DELETE FROM premissas WHERE tipo = ?", (tipo,))
-    conn.commit()
-    conn.close()
+    get_thread_connection().execute(_SQL_DELETE, (tipo,))
+    _CACHE.pop(tipo, None)
@@ -4,7 +4,11 @@ Dados extraídos da tabela oficial GFF.
 Executar uma vez: python gerar_modelos.py
 """
 import os
-import pandas as pd
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import xlsxwriter
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 OUTPUT_DIR = os.path.join(BASE_DIR, "modelos_carteira")
@@ -32,78 +36,85 @@ MODELO_COMPLETO = [
     ("LOCAL HEDGES", "ALTS", "SEM NADA NO MOMENTO", 0.0, 0.0, 0.0, 0.0, 0, 0, 0, 2.5, 0, 5, 0, 7.5),
 ]
 
-PERFIS = {
-    "renda_fixa": {"idx_hoje": 3, "idx_min": 7, "idx_max": 8, "label": "Renda Fixa"},
-    "conservador": {"idx_hoje": 4, "idx_min": 9, "idx_max": 10, "label": "Conservador"},
-    "moderado": {"idx_hoje": 5, "idx_min": 11, "idx_max": 12, "label": "Moderado"},
-    "agressivo": {"idx_hoje": 6, "idx_min": 13, "idx_max": 14, "label": "Agressivo"},
-}
-
-
-def gerar_excel_perfil(perfil_key, info):
+# ── Mesma tabela em colunas (texto) + matriz numérica (N, 12) ──
+# MATRIX: RF_hoje, Cons_hoje, Mod_hoje, Agr_hoje, RF_min, RF_max, Cons_min,
+#         Cons_max, Mod_min, Mod_max, Agr_min, Agr_max
+CLASSES = np.array([m[0] for m in MODELO_COMPLETO], dtype=object)
+SUBCATS = np.array([m[1] for m in MODELO_COMPLETO], dtype=object)
+ATIVOS = np.array([m[2] for m in MODELO_COMPLETO], dtype=object)
+MATRIX = np.array([m[3:15] for m in MODELO_COMPLETO], dtype=np.float64)
+# Linhas com alocação (% HOJE > 0), uma coluna por perfil
+ATIVOS_MASK = MATRIX[:, :4] > 0
+
+# col_*: índices de coluna na MATRIX
+Perfil = namedtuple("Perfil", "key label col_hoje col_min col_max")
+PERFIS = (
+    Perfil("renda_fixa", "Renda Fixa", 0, 4, 5),
+    Perfil("conservador", "Conservador", 1, 6, 7),
+    Perfil("moderado", "Moderado", 2, 8, 9),
+    Perfil("agressivo", "Agressivo", 3, 10, 11),
+)
+
+
+HEADER_PERFIL = ("Classe", "Subcategoria", "Ativo", "% Alvo", "Min %", "Max %")
+HEADER_MASTER = (
+    "Classe Ativo", "Subcategoria", "Ativo",
+    "Renda Fixa HOJE", "Conservador HOJE", "Moderado HOJE", "Agressivo HOJE",
+    "RF Min", "RF Max", "Cons Min", "Cons Max", "Mod Min", "Mod Max", "Agr Min", "Agr Max",
+)
+
+
+def _write_sheet(workbook, sheet_name, header, rows, header_fmt):
+    """Escreve cabeçalho + linhas direto no worksheet (sem DataFrame)."""
+    ws = workbook.add_worksheet(sheet_name)
+    ws.write_row(0, 0, header, header_fmt)
+    n = 0
+    for n, row in enumerate(rows, start=1):
+        ws.write_row(n, 0, row)
+    return n
+
+
+def gerar_excel_perfil(perfil):
     """Gera Excel de um perfil com dados completos."""
-    rows = []
-    for m in MODELO_COMPLETO:
-        pct = m[info["idx_hoje"]]
-        rows.append({
-            "Classe": m[0],
-            "Subcategoria": m[1],
-            "Ativo": m[2],
-            "% Alvo": pct,
-            "Min %": m[info["idx_min"]],
-            "Max %": m[info["idx_max"]],
-        })
-
-    df = pd.DataFrame(rows)
-    path = os.path.join(OUTPUT_DIR, f"{perfil_key}.xlsx")
-
-    with pd.ExcelWriter(path, engine="openpyxl") as writer:
+    hoje = MATRIX[:, perfil.col_hoje]
+    cols = (CLASSES, SUBCATS, ATIVOS, hoje, MATRIX[:, perfil.col_min], MATRIX[:, perfil.col_max])
+    mask = ATIVOS_MASK[:, perfil.col_hoje]
+    path = os.path.join(OUTPUT_DIR, f"{perfil.key}.xlsx")
+
+    with xlsxwriter.Workbook(path) as wb:
+        header_fmt = wb.add_format({"bold": True, "border": 1, "align": "center"})
         # Sheet 1: Modelo completo (todas as linhas)
-        df.to_excel(writer, sheet_name="Modelo", index=False)
+        _write_sheet(wb, "Modelo", HEADER_PERFIL, zip(*(c.tolist() for c in cols)), header_fmt)
 
         # Sheet 2: Apenas alocações ativas (% > 0)
-        df_ativo = df[df["% Alvo"] > 0].reset_index(drop=True)
-        df_ativo.to_excel(writer, sheet_name="Ativos", index=False)
+        n_ativos = _write_sheet(
+            wb, "Ativos", HEADER_PERFIL, zip(*(c[mask].tolist() for c in cols)), header_fmt,
+        )
 
-    print(f"  OK {path} ({len(df_ativo)} ativos com alocacao)")
-    return df
+    print(f"  OK {path} ({n_ativos} ativos com alocacao)")
 
 
 def gerar_master_excel():
     """Gera Excel mestre com todos os perfis."""
-    rows = []
-    for m in MODELO_COMPLETO:
-        rows.append({
-            "Classe Ativo": m[0],
-            "Subcategoria": m[1],
-            "Ativo": m[2],
-            "Renda Fixa HOJE": m[3],
-            "Conservador HOJE": m[4],
-            "Moderado HOJE": m[5],
-            "Agressivo HOJE": m[6],
-            "RF Min": m[7], "RF Max": m[8],
-            "Cons Min": m[9], "Cons Max": m[10],
-            "Mod Min": m[11], "Mod Max": m[12],
-            "Agr Min": m[13], "Agr Max": m[14],
-        })
-
-    df = pd.DataFrame(rows)
     path = os.path.join(OUTPUT_DIR, "_master_modelos.xlsx")
-    df.to_excel(path, index=False, engine="openpyxl")
+    rows = zip(CLASSES.tolist(), SUBCATS.tolist(), ATIVOS.tolist(), *MATRIX.T.tolist())
+    with xlsxwriter.Workbook(path) as wb:
+        header_fmt = wb.add_format({"bold": True, "border": 1, "align": "center"})
+        _write_sheet(wb, "Sheet1", HEADER_MASTER, rows, header_fmt)
     print(f"  OK Master: {path}")
 
-    # Totais
-    for perfil_label, col in [("Renda Fixa", "Renda Fixa HOJE"), ("Conservador", "Conservador HOJE"),
-                               ("Moderado", "Moderado HOJE"), ("Agressivo", "Agressivo HOJE")]:
-        total = df[col].sum()
-        print(f"    {perfil_label}: {total:.1f}%")
+    # Totais (colunas HOJE = 0..3 da MATRIX)
+    totais = MATRIX[:, :4].sum(axis=0)
+    for perfil in PERFIS:
+        print(f"    {perfil.label}: {totais[perfil.col_hoje]:.1f}%")
 
 
 if __name__ == "__main__":
     print("Gerando carteiras modelo TAG...\n")
 
-    for key, info in PERFIS.items():
-        gerar_excel_perfil(key, info)
+    # Perfis são independentes: um arquivo por processo
+    with ProcessPoolExecutor(max_workers=len(PERFIS)) as ex:
+        list(ex.map(gerar_excel_perfil, PERFIS))
 
     print()
     gerar_master_excel()
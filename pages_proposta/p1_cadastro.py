@@ -9,6 +9,7 @@ import streamlit as st
 import json
 import pandas as pd
 from datetime import date
+from functools import lru_cache
 
 from shared.brand import TAG, render_card, render_status_badge, fmt_brl
 from shared.validators import (
@@ -18,10 +19,10 @@ from shared.validators import (
     validate_prospect_completeness,
 )
 from database.models import (
-    create_prospect,
-    update_prospect,
     get_prospect,
+    upsert_prospect,
     list_prospects,
+    prospects_fingerprint,
 )
 
 PERFIS = ["Conservador", "Moderado", "Arrojado", "Agressivo"]
@@ -57,6 +58,10 @@ PIPELINE_STATUS = [
     "Cliente",
     "Perdido",
 ]
+# value -> position, for selectbox default indices
+PERFIS_IDX = {v: i for i, v in enumerate(PERFIS)}
+HORIZONTES_IDX = {v: i for i, v in enumerate(HORIZONTES)}
+PIPELINE_STATUS_IDX = {v: i for i, v in enumerate(PIPELINE_STATUS)}
 
 RELACOES_FAMILIARES = [
     "Cônjuge", "Filho(a)", "Neto(a)", "Pai/Mãe",
@@ -69,6 +74,20 @@ REGIMES_CASAMENTO = [
     "Participação final nos aquestos",
     "N/A",
 ]
+_FAMILY_COLUMN_CONFIG = {
+    "nome": st.column_config.TextColumn("Nome", width="large"),
+    "relacao": st.column_config.SelectboxColumn(
+        "Relação",
+        options=RELACOES_FAMILIARES,
+        width="medium",
+    ),
+    "idade": st.column_config.NumberColumn("Idade", min_value=0, max_value=120, width="small"),
+    "regime_casamento": st.column_config.SelectboxColumn(
+        "Regime Casamento",
+        options=REGIMES_CASAMENTO,
+        width="medium",
+    ),
+}
 TIPOS_ESTRUTURA = [
     "Pessoa Física",
     "Pessoa Jurídica",
@@ -85,6 +104,9 @@ JURISDICOES_OFFSHORE = [
     "Outro",
 ]
 TIPOS_OFFSHORE = ["PIC", "Trust", "LLC", "Foundation", "Outro"]
+TIPOS_ESTRUTURA_IDX = {v: i for i, v in enumerate(TIPOS_ESTRUTURA)}
+JURISDICOES_OFFSHORE_IDX = {v: i for i, v in enumerate(JURISDICOES_OFFSHORE)}
+TIPOS_OFFSHORE_IDX = {v: i for i, v in enumerate(TIPOS_OFFSHORE)}
 SERVICOS_DISPONIVEIS = [
     "Gestão de investimentos",
     "Planejamento sucessório",
@@ -93,16 +115,72 @@ SERVICOS_DISPONIVEIS = [
     "Investimentos alternativos",
     "Produtos estruturados",
 ]
+# Membership sets for filtering stored selections against the option lists
+_OBJETIVOS_SET = frozenset(OBJETIVOS_OPTIONS)
+_RESTRICOES_SET = frozenset(RESTRICOES_OPTIONS)
+_SERVICOS_SET = frozenset(SERVICOS_DISPONIVEIS)
+
+
+def _safe_index(lst_idx, val, default=0):
+    """Selectbox index of ``val`` in a *_IDX map, or ``default`` if absent."""
+    return lst_idx.get(val, default)
+
+
+# ── HTML templates (TAG colors are static, so they are baked in once) ──
+_VALIDATION_OK_TPL = f'<span style="color:{TAG["verde"]};font-size:0.78rem">✅ {{msg}}</span>'
+_VALIDATION_ERR_TPL = f'<span style="color:{TAG["rosa"]};font-size:0.78rem">❌ {{msg}}</span>'
+_VALIDATION_ROW_TPL = '<div style="display:flex;gap:20px;flex-wrap:wrap;margin-top:4px">{msgs}</div>'
+_FEE_CARD_TPL = (
+    f'<div class="tag-card" style="padding:12px 16px;margin-top:8px">'
+    f'<div style="color:{TAG["laranja"]};font-weight:600;font-size:0.85rem;margin-bottom:6px">'
+    f'💰 Estimativa de Receita</div>'
+    f'<div style="display:flex;gap:24px">'
+    f'<div><span style="color:{TAG["text_muted"]};font-size:0.78rem">Anual:</span> '
+    f'<span style="color:{TAG["offwhite"]};font-weight:600">{{annual}}</span></div>'
+    f'<div><span style="color:{TAG["text_muted"]};font-size:0.78rem">Mensal:</span> '
+    f'<span style="color:{TAG["offwhite"]};font-weight:600">{{monthly}}</span></div>'
+    f'</div></div>'
+)
+_HDR_TPL = f'<p style="color:{TAG["text_muted"]};font-size:0.9rem">{{text}}</p>'
+_HDR_FAMILIA = _HDR_TPL.format(
+    text="Registre os membros da família para análise de planejamento sucessório e patrimonial."
+)
+_HDR_PATRIMONIAL = _HDR_TPL.format(
+    text="Defina a estrutura patrimonial atual do prospect (tipo de pessoa/entidade, offshore, holdings)."
+)
+_HDR_FEE = _HDR_TPL.format(
+    text="Configure a taxa de administração negociada e os serviços incluídos na proposta."
+)
+
+# Validators are pure functions of the raw string and run on every render
+# and again on submit; memoize them per input.
+_v_cpf_cnpj = lru_cache(maxsize=512)(validate_cpf_cnpj)
+_v_email = lru_cache(maxsize=512)(validate_email)
+_v_phone = lru_cache(maxsize=512)(validate_phone)
+
+
+# ── Cached DB reads ──
+@st.cache_data(show_spinner=False, max_entries=8)
+def _prospect_index(fingerprint):
+    """Selector labels (with the "+ Novo Prospect" entry) and label -> prospect id.
+
+    Keyed on prospects_fingerprint(), which changes with every write from any
+    session, so the shared cache entry is never stale.
+    """
+    names = ["+ Novo Prospect"]
+    by_name = {}
+    for p in list_prospects(columns=("id", "nome", "status")):
+        label = f"{p['nome']} ({p['status']})"
+        names.append(label)
+        by_name.setdefault(label, p["id"])
+    return names, by_name
 
 
 def render_cadastro():
     st.title("Cadastro de Prospect")
 
     # ── Select existing or create new ──
-    prospects = list_prospects()
-    prospect_names = ["+ Novo Prospect"] + [
-        f"{p['nome']} ({p['status']})" for p in prospects
-    ]
+    prospect_names, prospect_ids = _prospect_index(prospects_fingerprint())
 
     selected = st.selectbox(
         "Selecionar prospect",
@@ -112,9 +190,8 @@ def render_cadastro():
 
     editing = selected != "+ Novo Prospect"
     if editing:
-        idx = prospect_names.index(selected) - 1
-        prospect = get_prospect(prospects[idx]["id"])
-        prospect_id = prospect["id"]
+        prospect_id = prospect_ids[selected]
+        prospect = get_prospect(prospect_id) or {}
     else:
         prospect = {}
         prospect_id = None
@@ -127,6 +204,8 @@ def render_cadastro():
     _init_family_state(prospect)
 
     # ── TABS for organized sections ──
+    # st.tabs exposes no active tab, so all six bodies are built on each run;
+    # they all feed the single submit below (see the form note).
     tabs = st.tabs([
         "📋 Dados Pessoais",
         "💰 Perfil Investidor",
@@ -137,6 +216,9 @@ def render_cadastro():
     ])
 
     # ── Form ──
+    # Widgets inside the form don't trigger reruns: the tabs (and the field
+    # validations) only re-execute on prospect switch or submit, which is
+    # the scoping st.fragment would otherwise provide.
     with st.form("prospect_form", clear_on_submit=False):
 
         # ── TAB 1: Dados Pessoais ──
@@ -189,7 +271,7 @@ def render_cadastro():
         with tabs[1]:
             col1, col2, col3 = st.columns(3)
             with col1:
-                perfil_idx = PERFIS.index(prospect.get("perfil_investidor", "Moderado")) if prospect.get("perfil_investidor") in PERFIS else 1
+                perfil_idx = _safe_index(PERFIS_IDX, prospect.get("perfil_investidor"), 1)
                 perfil = st.selectbox("Perfil *", PERFIS, index=perfil_idx)
             with col2:
                 patrimonio_total = st.number_input(
@@ -214,7 +296,7 @@ def render_cadastro():
 
             col1, col2 = st.columns(2)
             with col1:
-                horiz_idx = HORIZONTES.index(prospect.get("horizonte_investimento", HORIZONTES[1])) if prospect.get("horizonte_investimento") in HORIZONTES else 1
+                horiz_idx = _safe_index(HORIZONTES_IDX, prospect.get("horizonte_investimento"), 1)
                 horizonte = st.selectbox("Horizonte de investimento", HORIZONTES, index=horiz_idx)
             with col2:
                 retirada = st.number_input(
@@ -247,7 +329,7 @@ def render_cadastro():
             objetivos = st.multiselect(
                 "Selecione os objetivos do prospect",
                 OBJETIVOS_OPTIONS,
-                default=[o for o in current_objetivos if o in OBJETIVOS_OPTIONS],
+                default=[o for o in current_objetivos if o in _OBJETIVOS_SET],
             )
 
             st.markdown("---")
@@ -258,7 +340,7 @@ def render_cadastro():
             restricoes = st.multiselect(
                 "Restrições de investimento",
                 RESTRICOES_OPTIONS,
-                default=[r for r in current_restricoes if r in RESTRICOES_OPTIONS],
+                default=[r for r in current_restricoes if r in _RESTRICOES_SET],
             )
             restricoes_texto = st.text_area(
                 "Outras restrições (texto livre)",
@@ -271,45 +353,20 @@ def render_cadastro():
 
         # ── TAB 3: Estrutura Familiar ──
         with tabs[2]:
-            st.markdown(
-                f'<p style="color:{TAG["text_muted"]};font-size:0.9rem">'
-                f"Registre os membros da família para análise de planejamento sucessório e patrimonial."
-                f"</p>",
-                unsafe_allow_html=True,
-            )
+            st.markdown(_HDR_FAMILIA, unsafe_allow_html=True)
 
-            # Load existing data
-            existing_family = prospect.get("estrutura_familiar", [])
-            if not isinstance(existing_family, list):
-                existing_family = []
-
-            # Use data_editor for family members
-            family_df = pd.DataFrame(
-                existing_family if existing_family else [],
-                columns=["nome", "relacao", "idade", "regime_casamento"],
-            )
-            if family_df.empty:
-                family_df = pd.DataFrame(
-                    [{"nome": "", "relacao": "Filho(a)", "idade": 0, "regime_casamento": "N/A"}],
-                    columns=["nome", "relacao", "idade", "regime_casamento"],
-                )
+            # Use data_editor for family members. The source frame is kept in
+            # session_state per selected prospect so it isn't rebuilt on every
+            # rerun and the editor always diffs against the same object.
+            cached_family = st.session_state.get("_family_df")
+            family_key = (prospect_id, prospect.get("updated_at"))
+            if cached_family is None or cached_family[0] != family_key:
+                cached_family = (family_key, _build_family_df(prospect))
+                st.session_state["_family_df"] = cached_family
 
             family_edited = st.data_editor(
-                family_df,
-                column_config={
-                    "nome": st.column_config.TextColumn("Nome", width="large"),
-                    "relacao": st.column_config.SelectboxColumn(
-                        "Relação",
-                        options=RELACOES_FAMILIARES,
-                        width="medium",
-                    ),
-                    "idade": st.column_config.NumberColumn("Idade", min_value=0, max_value=120, width="small"),
-                    "regime_casamento": st.column_config.SelectboxColumn(
-                        "Regime Casamento",
-                        options=REGIMES_CASAMENTO,
-                        width="medium",
-                    ),
-                },
+                cached_family[1],
+                column_config=_FAMILY_COLUMN_CONFIG,
                 num_rows="dynamic",
                 use_container_width=True,
                 key="family_editor",
@@ -334,12 +391,7 @@ def render_cadastro():
 
         # ── TAB 4: Estrutura Patrimonial ──
         with tabs[3]:
-            st.markdown(
-                f'<p style="color:{TAG["text_muted"]};font-size:0.9rem">'
-                f"Defina a estrutura patrimonial atual do prospect (tipo de pessoa/entidade, offshore, holdings)."
-                f"</p>",
-                unsafe_allow_html=True,
-            )
+            st.markdown(_HDR_PATRIMONIAL, unsafe_allow_html=True)
 
             estr_patrim = prospect.get("estrutura_patrimonial", {})
             if not isinstance(estr_patrim, dict):
@@ -347,14 +399,10 @@ def render_cadastro():
 
             col1, col2 = st.columns(2)
             with col1:
-                tipo_estr_idx = 0
-                tipo_estr_val = estr_patrim.get("tipo", "Pessoa Física")
-                if tipo_estr_val in TIPOS_ESTRUTURA:
-                    tipo_estr_idx = TIPOS_ESTRUTURA.index(tipo_estr_val)
                 tipo_estrutura = st.selectbox(
                     "Tipo de estrutura",
                     TIPOS_ESTRUTURA,
-                    index=tipo_estr_idx,
+                    index=_safe_index(TIPOS_ESTRUTURA_IDX, estr_patrim.get("tipo")),
                     key="tipo_estrutura",
                 )
             with col2:
@@ -369,25 +417,17 @@ def render_cadastro():
                 st.markdown("**Detalhes Offshore**")
                 col1, col2, col3 = st.columns(3)
                 with col1:
-                    jur_idx = 0
-                    jur_val = estr_patrim.get("jurisdicao", JURISDICOES_OFFSHORE[0])
-                    if jur_val in JURISDICOES_OFFSHORE:
-                        jur_idx = JURISDICOES_OFFSHORE.index(jur_val)
                     jurisdicao = st.selectbox(
                         "Jurisdição",
                         JURISDICOES_OFFSHORE,
-                        index=jur_idx,
+                        index=_safe_index(JURISDICOES_OFFSHORE_IDX, estr_patrim.get("jurisdicao")),
                         key="jurisdicao",
                     )
                 with col2:
-                    tipo_off_idx = 0
-                    tipo_off_val = estr_patrim.get("tipo_offshore", TIPOS_OFFSHORE[0])
-                    if tipo_off_val in TIPOS_OFFSHORE:
-                        tipo_off_idx = TIPOS_OFFSHORE.index(tipo_off_val)
                     tipo_offshore = st.selectbox(
                         "Tipo de veículo",
                         TIPOS_OFFSHORE,
-                        index=tipo_off_idx,
+                        index=_safe_index(TIPOS_OFFSHORE_IDX, estr_patrim.get("tipo_offshore")),
                         key="tipo_offshore",
                     )
                 with col3:
@@ -442,12 +482,7 @@ def render_cadastro():
 
         # ── TAB 5: Fee / Proposta Comercial ──
         with tabs[4]:
-            st.markdown(
-                f'<p style="color:{TAG["text_muted"]};font-size:0.9rem">'
-                f"Configure a taxa de administração negociada e os serviços incluídos na proposta."
-                f"</p>",
-                unsafe_allow_html=True,
-            )
+            st.markdown(_HDR_FEE, unsafe_allow_html=True)
 
             fee_data = prospect.get("fee_negociada", {})
             if not isinstance(fee_data, dict):
@@ -488,19 +523,8 @@ def render_cadastro():
 
             # Fee revenue estimate
             if patrimonio_investivel > 0:
-                fee_rate = taxa_adm_1 if patrimonio_investivel <= 500_000_000 else taxa_adm_2
-                annual_fee = patrimonio_investivel * fee_rate / 100
-                monthly_fee = annual_fee / 12
                 st.markdown(
-                    f'<div class="tag-card" style="padding:12px 16px;margin-top:8px">'
-                    f'<div style="color:{TAG["laranja"]};font-weight:600;font-size:0.85rem;margin-bottom:6px">'
-                    f'💰 Estimativa de Receita</div>'
-                    f'<div style="display:flex;gap:24px">'
-                    f'<div><span style="color:{TAG["text_muted"]};font-size:0.78rem">Anual:</span> '
-                    f'<span style="color:{TAG["offwhite"]};font-weight:600">{fmt_brl(annual_fee)}</span></div>'
-                    f'<div><span style="color:{TAG["text_muted"]};font-size:0.78rem">Mensal:</span> '
-                    f'<span style="color:{TAG["offwhite"]};font-weight:600">{fmt_brl(monthly_fee)}</span></div>'
-                    f'</div></div>',
+                    _fee_card_html(patrimonio_investivel, taxa_adm_1, taxa_adm_2),
                     unsafe_allow_html=True,
                 )
 
@@ -510,7 +534,7 @@ def render_cadastro():
             servicos = st.multiselect(
                 "Selecione os serviços incluídos na proposta",
                 SERVICOS_DISPONIVEIS,
-                default=[s for s in current_servicos if s in SERVICOS_DISPONIVEIS],
+                default=[s for s in current_servicos if s in _SERVICOS_SET],
                 key="servicos_incluidos",
             )
 
@@ -527,7 +551,7 @@ def render_cadastro():
         with tabs[5]:
             col1, col2 = st.columns([1, 3])
             with col1:
-                status_idx = PIPELINE_STATUS.index(prospect.get("status", "Lead")) if prospect.get("status") in PIPELINE_STATUS else 0
+                status_idx = _safe_index(PIPELINE_STATUS_IDX, prospect.get("status"))
                 status = st.selectbox("Status", PIPELINE_STATUS, index=status_idx)
             with col2:
                 observacoes = st.text_area(
@@ -557,7 +581,7 @@ def render_cadastro():
     # ── Handle submission ──
     if submitted:
         # Validate fields before saving
-        errors = _validate_all_fields(nome, cpf_cnpj, email, telefone)
+        errors, cpf_formatted, phone_formatted = _validate_all_fields(nome, cpf_cnpj, email, telefone)
         if errors:
             for err in errors:
                 st.error(err)
@@ -566,14 +590,13 @@ def render_cadastro():
         # Build family list from data_editor
         family_list = []
         if family_edited is not None and not family_edited.empty:
-            for _, row in family_edited.iterrows():
-                if row.get("nome") and str(row["nome"]).strip():
-                    family_list.append({
-                        "nome": str(row["nome"]).strip(),
-                        "relacao": str(row.get("relacao", "Outro")),
-                        "idade": int(row.get("idade", 0)),
-                        "regime_casamento": str(row.get("regime_casamento", "N/A")),
-                    })
+            fe = family_edited[["nome", "relacao", "idade", "regime_casamento"]].copy()
+            fe["nome"] = fe["nome"].fillna("").astype(str).str.strip()
+            fe = fe[fe["nome"] != ""]
+            fe["relacao"] = fe["relacao"].fillna("Outro").astype(str)
+            fe["idade"] = fe["idade"].fillna(0).astype(int)
+            fe["regime_casamento"] = fe["regime_casamento"].fillna("N/A").astype(str)
+            family_list = fe.to_dict(orient="records")
 
         # Build estrutura_patrimonial
         estrutura_patrim = {
@@ -606,14 +629,6 @@ def render_cadastro():
             "condicoes_especiais": condicoes_especiais,
         }
 
-        # Format validated fields
-        _, cpf_formatted, _, _ = validate_cpf_cnpj(cpf_cnpj)
-        _, _, phone_formatted, _ = True, True, telefone.strip(), ""
-        try:
-            _, phone_formatted, _ = validate_phone(telefone)
-        except Exception:
-            phone_formatted = telefone.strip()
-
         data = {
             "nome": nome.strip(),
             "cpf_cnpj": cpf_formatted if cpf_formatted else cpf_cnpj.strip(),
@@ -638,10 +653,13 @@ def render_cadastro():
         }
 
         if editing:
-            update_prospect(prospect_id, data)
+            # Only write the fields that differ from the loaded prospect
+            changed = {k: v for k, v in data.items() if prospect.get(k) != v}
+            if changed:
+                upsert_prospect(changed, prospect_id)
             st.success(f"Prospect **{nome}** atualizado com sucesso!")
         else:
-            new_id = create_prospect(data)
+            new_id = upsert_prospect(data)
             st.success(f"Prospect **{nome}** cadastrado com sucesso! (ID: {new_id})")
         st.rerun()
 
@@ -667,11 +685,11 @@ def render_cadastro():
 
         # Family summary
         family = prospect.get("estrutura_familiar", [])
-        if family and isinstance(family, list) and any(m.get("nome") for m in family):
+        named = [m for m in family if m.get("nome")] if isinstance(family, list) else []
+        if named:
             st.markdown("**Estrutura Familiar:**")
-            for m in family:
-                if m.get("nome"):
-                    st.markdown(f"- {m['nome']} ({m.get('relacao', '')}, {m.get('idade', '?')} anos)")
+            for m in named:
+                st.markdown(f"- {m['nome']} ({m.get('relacao', '')}, {m.get('idade', '?')} anos)")
 
         # Fee summary
         fee = prospect.get("fee_negociada", {})
@@ -694,8 +712,13 @@ def render_cadastro():
 # ═══════════════════════════════════════════════════════════
 
 def _validate_all_fields(nome, cpf_cnpj, email, telefone):
-    """Validate all fields and return list of error messages."""
+    """Validate all fields.
+
+    Returns (errors, cpf_formatted, phone_formatted); the formatted values are
+    "" for empty fields.
+    """
     errors = []
+    cpf_formatted = phone_formatted = ""
 
     # Nome obrigatório
     if not nome or not nome.strip():
@@ -703,78 +726,81 @@ def _validate_all_fields(nome, cpf_cnpj, email, telefone):
 
     # CPF/CNPJ
     if cpf_cnpj and cpf_cnpj.strip():
-        is_valid, _, err_msg, _ = validate_cpf_cnpj(cpf_cnpj)
+        is_valid, cpf_formatted, err_msg, _ = _v_cpf_cnpj(cpf_cnpj)
         if not is_valid:
             errors.append(f"❌ {err_msg}")
 
     # Email
     if email and email.strip():
-        is_valid, err_msg = validate_email(email)
+        is_valid, err_msg = _v_email(email)
         if not is_valid:
             errors.append(f"❌ {err_msg}")
 
     # Telefone
     if telefone and telefone.strip():
-        is_valid, _, err_msg = validate_phone(telefone)
+        is_valid, phone_formatted, err_msg = _v_phone(telefone)
         if not is_valid:
             errors.append(f"❌ {err_msg}")
 
-    return errors
+    return errors, cpf_formatted, phone_formatted
 
 
 def _show_field_validations(cpf_cnpj, email, telefone):
-    """Show real-time field validation feedback."""
+    """Show real-time field validation feedback.
+
+    The rendered block is kept in session_state for the last inputs, so it is
+    only rebuilt when one of the three fields changes.
+    """
+    key = (cpf_cnpj, email, telefone)
+    cached = st.session_state.get("_val_html")
+    if cached is not None and cached[0] == key:
+        html = cached[1]
+    else:
+        html = _field_validations_html(cpf_cnpj, email, telefone)
+        st.session_state["_val_html"] = (key, html)
+    if html:
+        st.markdown(html, unsafe_allow_html=True)
+
+
+def _field_validations_html(cpf_cnpj, email, telefone):
+    """Build the validation feedback HTML ("" when there is nothing to show)."""
     validation_msgs = []
 
     # CPF/CNPJ validation
     if cpf_cnpj and cpf_cnpj.strip():
-        is_valid, formatted, err_msg, tipo = validate_cpf_cnpj(cpf_cnpj)
+        is_valid, formatted, err_msg, tipo = _v_cpf_cnpj(cpf_cnpj)
         if is_valid and formatted:
-            validation_msgs.append(
-                f'<span style="color:{TAG["verde"]};font-size:0.78rem">'
-                f'✅ {tipo} válido: {formatted}</span>'
-            )
+            validation_msgs.append(_VALIDATION_OK_TPL.format(msg=f"{tipo} válido: {formatted}"))
         elif not is_valid:
-            validation_msgs.append(
-                f'<span style="color:{TAG["rosa"]};font-size:0.78rem">'
-                f'❌ {err_msg}</span>'
-            )
+            validation_msgs.append(_VALIDATION_ERR_TPL.format(msg=err_msg))
 
     # Email validation
     if email and email.strip():
-        is_valid, err_msg = validate_email(email)
+        is_valid, err_msg = _v_email(email)
         if is_valid:
-            validation_msgs.append(
-                f'<span style="color:{TAG["verde"]};font-size:0.78rem">'
-                f'✅ Email válido</span>'
-            )
+            validation_msgs.append(_VALIDATION_OK_TPL.format(msg="Email válido"))
         else:
-            validation_msgs.append(
-                f'<span style="color:{TAG["rosa"]};font-size:0.78rem">'
-                f'❌ {err_msg}</span>'
-            )
+            validation_msgs.append(_VALIDATION_ERR_TPL.format(msg=err_msg))
 
     # Phone validation
     if telefone and telefone.strip():
-        is_valid, formatted, err_msg = validate_phone(telefone)
+        is_valid, formatted, err_msg = _v_phone(telefone)
         if is_valid and formatted:
-            validation_msgs.append(
-                f'<span style="color:{TAG["verde"]};font-size:0.78rem">'
-                f'✅ Telefone: {formatted}</span>'
-            )
+            validation_msgs.append(_VALIDATION_OK_TPL.format(msg=f"Telefone: {formatted}"))
         elif not is_valid:
-            validation_msgs.append(
-                f'<span style="color:{TAG["rosa"]};font-size:0.78rem">'
-                f'❌ {err_msg}</span>'
-            )
+            validation_msgs.append(_VALIDATION_ERR_TPL.format(msg=err_msg))
+
+    if not validation_msgs:
+        return ""
+    return _VALIDATION_ROW_TPL.format(msgs="".join(validation_msgs))
 
-    if validation_msgs:
-        st.markdown(
-            f'<div style="display:flex;gap:20px;flex-wrap:wrap;margin-top:4px">'
-            + "".join(validation_msgs)
-            + f'</div>',
-            unsafe_allow_html=True,
-        )
+
+@st.cache_data(ttl=300, show_spinner=False)
+def _fee_card_html(patrimonio_investivel, taxa_adm_1, taxa_adm_2):
+    """Fee revenue estimate card for the given patrimônio and tiered rates."""
+    fee_rate = taxa_adm_1 if patrimonio_investivel <= 500_000_000 else taxa_adm_2
+    annual_fee = patrimonio_investivel * fee_rate / 100
+    return _FEE_CARD_TPL.format(annual=fmt_brl(annual_fee), monthly=fmt_brl(annual_fee / 12))
 
 
 def _show_profile_hints(perfil, objetivos, horizonte):
@@ -809,19 +835,26 @@ def _show_profile_hints(perfil, objetivos, horizonte):
 
     if hints:
         st.markdown(
-            f'<div style="background:{TAG["amarelo"]}15;border:1px solid {TAG["amarelo"]}30;'
-            f'border-radius:8px;padding:10px 14px;margin-top:12px">'
-            f'<div style="color:{TAG["amarelo"]};font-weight:600;font-size:0.82rem;margin-bottom:6px">'
-            f'💡 Dicas de Consistência</div>',
+            _callout_html(TAG["amarelo"], "💡 Dicas de Consistência", hints),
             unsafe_allow_html=True,
         )
-        for h in hints:
-            st.markdown(
-                f'<div style="color:{TAG["text_muted"]};font-size:0.78rem;margin-bottom:4px">'
-                f'• {h}</div>',
-                unsafe_allow_html=True,
-            )
-        st.markdown('</div>', unsafe_allow_html=True)
+
+
+def _callout_html(color, title, items):
+    """Tinted box with a title and one bullet per item, as a single HTML string."""
+    parts = [
+        f'<div style="background:{color}15;border:1px solid {color}30;'
+        f'border-radius:8px;padding:10px 14px;margin-top:12px">'
+        f'<div style="color:{color};font-weight:600;font-size:0.82rem;margin-bottom:6px">'
+        f'{title}</div>'
+    ]
+    parts.extend(
+        f'<div style="color:{TAG["text_muted"]};font-size:0.78rem;margin-bottom:4px">'
+        f'• {item}</div>'
+        for item in items
+    )
+    parts.append('</div>')
+    return "".join(parts)
 
 
 def _show_family_insights(family_df, patrimonio_sucessao):
@@ -829,34 +862,29 @@ def _show_family_insights(family_df, patrimonio_sucessao):
     if family_df is None or family_df.empty:
         return
 
-    members = []
-    for _, row in family_df.iterrows():
-        if row.get("nome") and str(row["nome"]).strip():
-            members.append(row)
-
-    if not members:
+    # Only members with a name count
+    members = family_df[family_df["nome"].fillna("").astype(str).str.strip() != ""]
+    if members.empty:
         return
 
     insights = []
 
     # Count by relationship
-    n_filhos = sum(1 for m in members if str(m.get("relacao", "")).startswith("Filho"))
-    n_conjuge = sum(1 for m in members if str(m.get("relacao", "")) == "Cônjuge")
-    n_netos = sum(1 for m in members if str(m.get("relacao", "")).startswith("Neto"))
+    relacao = members["relacao"].astype(str)
+    counts = relacao.str.extract(r"^(Filho|Cônjuge$)", expand=False).value_counts()
+    n_filhos = int(counts.get("Filho", 0))
+    n_conjuge = int(counts.get("Cônjuge", 0))
 
     # Minor heirs check
-    menores = [m for m in members if int(m.get("idade", 0)) < 18 and int(m.get("idade", 0)) > 0]
-    if menores:
+    idades = pd.to_numeric(members["idade"], errors="coerce").fillna(0)
+    n_menores = int(((idades > 0) & (idades < 18)).sum())
+    if n_menores:
         insights.append(
-            f"⚠️ {len(menores)} herdeiro(s) menor(es) de idade - considerar tutela e curadoria."
+            f"⚠️ {n_menores} herdeiro(s) menor(es) de idade - considerar tutela e curadoria."
         )
 
     # Multiple marriages / regimes
-    regimes = set(
-        str(m.get("regime_casamento", "N/A"))
-        for m in members
-        if str(m.get("relacao", "")) == "Cônjuge"
-    )
+    regimes = set(members.loc[relacao == "Cônjuge", "regime_casamento"].astype(str))
     regimes.discard("N/A")
     if regimes:
         insights.append(
@@ -873,19 +901,9 @@ def _show_family_insights(family_df, patrimonio_sucessao):
 
     if insights:
         st.markdown(
-            f'<div style="background:{TAG["azul"]}15;border:1px solid {TAG["azul"]}30;'
-            f'border-radius:8px;padding:10px 14px;margin-top:12px">'
-            f'<div style="color:{TAG["azul"]};font-weight:600;font-size:0.82rem;margin-bottom:6px">'
-            f'📋 Insights Familiares</div>',
+            _callout_html(TAG["azul"], "📋 Insights Familiares", insights),
             unsafe_allow_html=True,
         )
-        for insight in insights:
-            st.markdown(
-                f'<div style="color:{TAG["text_muted"]};font-size:0.78rem;margin-bottom:4px">'
-                f'• {insight}</div>',
-                unsafe_allow_html=True,
-            )
-        st.markdown('</div>', unsafe_allow_html=True)
 
 
 def _render_completeness_badge(prospect):
@@ -912,7 +930,7 @@ def _render_completeness_badge(prospect):
     # Badge row
     bar_width = max(score, 3)
 
-    st.markdown(
+    parts = [
         f'<div style="background:{TAG["bg_card"]};border:1px solid {color}40;'
         f'border-radius:10px;padding:12px 16px;margin-bottom:16px">'
         f'<div style="display:flex;justify-content:space-between;align-items:center;margin-bottom:8px">'
@@ -923,28 +941,42 @@ def _render_completeness_badge(prospect):
         f'<div style="background:{TAG["bg_dark"]};border-radius:6px;height:6px;overflow:hidden">'
         f'<div style="width:{bar_width}%;height:100%;background:{color};border-radius:6px;'
         f'transition:width 0.3s"></div>'
-        f'</div>',
-        unsafe_allow_html=True,
-    )
+        f'</div>'
+    ]
 
     if missing:
-        st.markdown(
+        extra = f" +{len(missing) - 5} mais" if len(missing) > 5 else ""
+        parts.append(
             f'<div style="color:{TAG["text_muted"]};font-size:0.75rem;margin-top:6px">'
-            f'Campos pendentes: {", ".join(missing[:5])}'
-            + (f" +{len(missing)-5} mais" if len(missing) > 5 else "")
-            + f'</div>',
-            unsafe_allow_html=True,
+            f'Campos pendentes: {", ".join(missing[:5])}{extra}</div>'
         )
 
-    if recommendations:
-        for rec in recommendations[:2]:
-            st.markdown(
-                f'<div style="color:{TAG["text_muted"]};font-size:0.75rem">'
-                f'💡 {rec}</div>',
-                unsafe_allow_html=True,
-            )
+    parts.extend(
+        f'<div style="color:{TAG["text_muted"]};font-size:0.75rem">'
+        f'💡 {rec}</div>'
+        for rec in recommendations[:2]
+    )
+
+    parts.append('</div>')
+    st.markdown("".join(parts), unsafe_allow_html=True)
+
 
-    st.markdown('</div>', unsafe_allow_html=True)
+def _build_family_df(prospect):
+    """Family members of ``prospect`` as the data_editor source frame."""
+    existing_family = prospect.get("estrutura_familiar", [])
+    if not isinstance(existing_family, list):
+        existing_family = []
+
+    family_df = pd.DataFrame(
+        existing_family if existing_family else [],
+        columns=["nome", "relacao", "idade", "regime_casamento"],
+    )
+    if family_df.empty:
+        family_df = pd.DataFrame(
+            [{"nome": "", "relacao": "Filho(a)", "idade": 0, "regime_casamento": "N/A"}],
+            columns=["nome", "relacao", "idade", "regime_casamento"],
+        )
+    return family_df
 
 
 def _init_family_state(prospect):
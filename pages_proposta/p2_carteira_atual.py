@@ -2,76 +2,89 @@
 Tela 2: Carteira Atual do Prospect
 Upload, diagnostic and analysis of the prospect's current portfolio.
 """
-import json
-
 import numpy as np
 import pandas as pd
-import plotly.graph_objects as go
 import streamlit as st
 
 from shared.brand import TAG, PLOTLY_LAYOUT, fmt_brl, fmt_pct
-from shared.fund_utils import load_liquidation_data, find_col, match_fund_liquidation
+from shared.fund_utils import load_liquidation_data, find_col, match_liquidation_days
 from shared.portfolio_utils import parse_portfolio_file
-from database.models import list_prospects, get_prospect, update_prospect
+from database.db import json_dumps, json_loads
+from database.models import list_prospects, get_prospect, update_prospect, prospects_fingerprint
+
+
+_LIQ_BUCKETS = ("D+0-1", "D+2-5", "D+6-30", "D+30+")
+# Upper bound (inclusive, in days) of every bucket but the last
+_LIQ_BOUNDS = np.array([1, 5, 30])
+
+
+def _concentration(pct):
+    """HHI (sum of squared % PL), normalized HHI and top-3 share of a % PL array.
+
+    A dot product and a partial partition, so no squared or fully sorted
+    temporaries are built. The normalized HHI rescales [10000/n, 10000] to
+    [0, 1]; a single asset is fully concentrated (1.0).
+    """
+    n = len(pct)
+    hhi = float(pct @ pct)
+    floor = 10000.0 / max(n, 1)
+    hhi_normalized = (hhi - floor) / (10000.0 - floor) if n > 1 else 1.0
+    if n <= 3:
+        return hhi, hhi_normalized, float(pct.sum())
+    return hhi, hhi_normalized, float(np.partition(pct, n - 3)[-3:].sum())
 
 
 def _compute_diagnostico(carteira_df, liquid_df):
     """Compute portfolio diagnostic metrics."""
+    return _diagnostico_with_pct(carteira_df, liquid_df)[0]
+
+
+def _diagnostico_with_pct(carteira_df, liquid_df):
+    """Diagnostic metrics plus a copy of the carteira with its "% PL" column.
+
+    Returns (diag, carteira); diag is {} (and carteira unchanged) when there
+    is nothing to analyse.
+    """
     if carteira_df is None or carteira_df.empty:
-        return {}
+        return {}, carteira_df
 
     total = carteira_df["Financeiro"].sum()
     if total == 0:
-        return {}
+        return {}, carteira_df
 
     carteira_df = carteira_df.copy()
     carteira_df["% PL"] = carteira_df["Financeiro"] / total * 100
 
-    # Concentration (HHI)
-    hhi = (carteira_df["% PL"] ** 2).sum()
-    hhi_normalized = (hhi - 10000 / len(carteira_df)) / (10000 - 10000 / len(carteira_df)) if len(carteira_df) > 1 else 1
-
-    # Top 3 concentration
-    top3_pct = carteira_df.nlargest(3, "% PL")["% PL"].sum()
-
-    # Liquidity analysis
-    liq_buckets = {"D+0-1": 0, "D+2-5": 0, "D+6-30": 0, "D+30+": 0}
-    total_cost = 0
-    matched_count = 0
-
-    for _, row in carteira_df.iterrows():
-        code = str(row.get("Código", ""))
-        name = str(row.get("Ativo", ""))
-        fin = row["Financeiro"]
-
-        liq_info = match_fund_liquidation(name, code, liquid_df)
-        if liq_info is not None:
-            d_total = int(liq_info.get("Conversão Resgate", 0)) + int(liq_info.get("Liquid. Resgate", 0))
-            if d_total <= 1:
-                liq_buckets["D+0-1"] += fin
-            elif d_total <= 5:
-                liq_buckets["D+2-5"] += fin
-            elif d_total <= 30:
-                liq_buckets["D+6-30"] += fin
-            else:
-                liq_buckets["D+30+"] += fin
-            matched_count += 1
-        else:
-            liq_buckets["D+30+"] += fin
-
-    # Convert to percentages
-    for k in liq_buckets:
-        liq_buckets[k] = liq_buckets[k] / total * 100 if total > 0 else 0
-
-    # Categories
-    categorias = {}
-    for _, row in carteira_df.iterrows():
-        cat = str(row.get("Categoria", row.get("Estratégia", "Outros")))
-        if not cat or cat == "nan":
-            cat = "Outros"
-        categorias[cat] = categorias.get(cat, 0) + row["Financeiro"]
-
-    return {
+    # Concentration (HHI) and top 3 share
+    hhi, hhi_normalized, top3_pct = _concentration(carteira_df["% PL"].to_numpy(np.float64))
+
+    # Liquidity analysis (unmatched assets count as D+30+)
+    def _str_col(col):
+        if col in carteira_df.columns:
+            return carteira_df[col].astype(str)
+        return pd.Series("", index=carteira_df.index)
+
+    d_total = match_liquidation_days(_str_col("Código"), _str_col("Ativo"), liquid_df)
+    matched_count = int((~np.isnan(d_total)).sum())
+    # side="left" keeps each bound in its own bucket; NaN sorts past 30
+    bucket = np.searchsorted(_LIQ_BOUNDS, d_total, side="left")
+    bucket_sums = np.bincount(
+        bucket, weights=carteira_df["Financeiro"].fillna(0).to_numpy(np.float64), minlength=len(_LIQ_BUCKETS)
+    )
+
+    # Convert to percentages (total is non-zero past the early return)
+    liq_buckets = dict(zip(_LIQ_BUCKETS, (bucket_sums / total * 100).tolist()))
+
+    # Categories ("Categoria", else "Estratégia"; blanks/NaN -> "Outros"),
+    # in order of first appearance
+    cat_col = next((c for c in ("Categoria", "Estratégia") if c in carteira_df.columns), None)
+    if cat_col is None:
+        cat = pd.Series("Outros", index=carteira_df.index)
+    else:
+        cat = carteira_df[cat_col].astype(str).replace({"nan": "Outros", "": "Outros"})
+    categorias = carteira_df["Financeiro"].groupby(cat, sort=False).sum().to_dict()
+
+    diag = {
         "total_pl": total,
         "num_ativos": len(carteira_df),
         "hhi": hhi,
@@ -82,20 +95,133 @@ def _compute_diagnostico(carteira_df, liquid_df):
         "categorias_abs": categorias,
         "matched_funds": matched_count,
     }
+    return diag, carteira_df
+
+
+_DISPLAY_CATEGORY_COLS = ("Codigo", "Código", "Ativo", "Estrategia", "Estratégia", "Categoria")
+
+
+# Formats applied by the grid itself, so the columns stay numeric and sort by value
+_DISPLAY_COLUMN_CONFIG = {
+    "Financeiro": st.column_config.NumberColumn("Financeiro", format="R$ %.2f"),
+    "% PL": st.column_config.NumberColumn("% PL", format="%.2f%%"),
+}
+
+
+def _with_categories(df):
+    """``df`` with its text columns as category dtype (dictionary-encoded by Arrow)."""
+    cols = [c for c in _DISPLAY_CATEGORY_COLS if c in df.columns]
+    return df.astype({c: "category" for c in cols}) if cols else df
+
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def _cached_diagnostico(carteira_df, _liquid_df):
+    """_diagnostico_with_pct memoized on the carteira contents.
+
+    The liquidation data is loaded once per process and never changes, so it
+    is left out of the cache key (leading underscore).
+    """
+    return _diagnostico_with_pct(carteira_df, _liquid_df)
+
+
+def _session_diagnostico(carteira_df, liquid_df):
+    """_cached_diagnostico, short-circuited while the carteira is unchanged.
+
+    The last (content hash, result) pair lives in session_state, so reruns
+    triggered by unrelated widgets skip cache_data's pickling of the frame.
+    """
+    key = (
+        tuple(carteira_df.columns),
+        hash(pd.util.hash_pandas_object(carteira_df, index=False).to_numpy().tobytes()),
+    )
+    prev = st.session_state.get("_diag_cache")
+    if prev is not None and prev[0] == key:
+        return prev[1]
+    result = _cached_diagnostico(carteira_df, liquid_df)
+    st.session_state["_diag_cache"] = (key, result)
+    return result
+
+
+def _diagnostic_figures(diag):
+    """(allocation pie or None, liquidity bar) for ``diag``.
+
+    The last pair is kept in session_state keyed on the charted values, so
+    reruns with the same diagnostic reuse the figures instead of rebuilding
+    them.
+    """
+    cats = diag["categorias"]
+    buckets = diag["liq_buckets"]
+    key = (tuple(cats.items()), tuple(buckets.items()))
+    prev = st.session_state.get("_diag_figs")
+    if prev is not None and prev[0] == key:
+        return prev[1]
+
+    # plotly is only needed once a diagnostic exists; importing it here
+    # keeps it off the path of the prospect-selection reruns.
+    import plotly.graph_objects as go
+
+    fig_cats = None
+    if cats:
+        fig_cats = go.Figure(
+            go.Pie(
+                labels=list(cats.keys()),
+                values=list(cats.values()),
+                hole=0.55,
+                textinfo="label+percent",
+                textposition="outside",
+                textfont=dict(size=11, color=TAG["offwhite"]),
+                marker=dict(
+                    colors=TAG["chart"],
+                    line=dict(color=TAG["bg_dark"], width=1.5),
+                ),
+                hovertemplate="<b>%{label}</b><br>%{value:.1f}%<extra></extra>",
+            )
+        )
+        fig_cats.update_layout(**PLOTLY_LAYOUT, height=380, showlegend=False)
+
+    bucket_names = list(buckets.keys())
+    bucket_vals = list(buckets.values())
+    colors = [TAG["verde"], TAG["azul"], TAG["amarelo"], TAG["rosa"]]
+
+    fig_liq = go.Figure(
+        go.Bar(
+            x=bucket_vals,
+            y=bucket_names,
+            orientation="h",
+            marker_color=colors[:len(bucket_names)],
+            text=[f"{v:.1f}%" for v in bucket_vals],
+            textposition="auto",
+            textfont=dict(color=TAG["offwhite"]),
+        )
+    )
+    fig_liq.update_layout(**PLOTLY_LAYOUT, height=380, showlegend=False)
+    fig_liq.update_xaxes(title_text="% do PL")
+
+    st.session_state["_diag_figs"] = (key, (fig_cats, fig_liq))
+    return fig_cats, fig_liq
+
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def _prospect_options(fingerprint):
+    """(ids, labels) for the prospect selector, keyed on prospects_fingerprint()."""
+    prospects = list_prospects(columns=("id", "nome", "perfil_investidor", "patrimonio_investivel"))
+    ids = [p["id"] for p in prospects]
+    labels = [f"{p['nome']} - {p['perfil_investidor']} ({fmt_brl(p['patrimonio_investivel'])})" for p in prospects]
+    return ids, labels
 
 
 def render_carteira_atual():
     st.title("Carteira Atual do Prospect")
 
     # ── Select prospect ──
-    prospects = list_prospects()
-    if not prospects:
+    prospect_ids, prospect_names = _prospect_options(prospects_fingerprint())
+    if not prospect_ids:
         st.warning("Nenhum prospect cadastrado. Vá para 'Cadastro de Prospect' primeiro.")
         return
 
-    prospect_names = [f"{p['nome']} - {p['perfil_investidor']} ({fmt_brl(p['patrimonio_investivel'])})" for p in prospects]
     selected_idx = st.selectbox("Selecionar prospect", range(len(prospect_names)), format_func=lambda i: prospect_names[i])
-    prospect = get_prospect(prospects[selected_idx]["id"])
+    # The selected row itself is read fresh: this page writes its carteira_dados
+    prospect = get_prospect(prospect_ids[selected_idx])
 
     st.markdown("---")
 
@@ -123,17 +249,21 @@ def render_carteira_atual():
                     fin_col = find_col(ativos_df, "FINANCEIRO", "VALOR")
                     strat_col = find_col(ativos_df, "ESTRATEGIA", "ESTRATEGIA", "CATEGORIA")
 
-                    rows = []
-                    for _, row in ativos_df.iterrows():
-                        fin = float(row.get(fin_col, 0)) if fin_col else 0
-                        if fin > 0:
-                            rows.append({
-                                "Codigo": str(row[cod_col]) if cod_col else "",
-                                "Ativo": str(row[name_col]) if name_col else "",
-                                "Financeiro": fin,
-                                "Estrategia": str(row[strat_col]) if strat_col else "",
-                            })
-                    carteira_df = pd.DataFrame(rows)
+                    if fin_col:
+                        fin = pd.to_numeric(ativos_df[fin_col], errors="coerce").fillna(0).astype(float)
+                    else:
+                        fin = pd.Series(0.0, index=ativos_df.index)
+                    keep = fin > 0
+
+                    def _text(col):
+                        return ativos_df.loc[keep, col].astype(str) if col else ""
+
+                    carteira_df = pd.DataFrame({
+                        "Codigo": _text(cod_col),
+                        "Ativo": _text(name_col),
+                        "Financeiro": fin[keep],
+                        "Estrategia": _text(strat_col),
+                    }).reset_index(drop=True)
                     st.success(f"Carteira importada: {len(carteira_df)} ativos")
                 else:
                     df = pd.read_excel(uploaded)
@@ -156,15 +286,9 @@ def render_carteira_atual():
                     parse_proposal_excel, portfolio_to_standard_format,
                     build_category_summary,
                 )
-                import tempfile, os
+                import io
 
-                # Save uploaded file temporarily
-                with tempfile.NamedTemporaryFile(delete=False, suffix=".xlsx") as tmp:
-                    tmp.write(uploaded_prop.read())
-                    tmp_path = tmp.name
-
-                parsed = parse_proposal_excel(tmp_path)
-                os.unlink(tmp_path)
+                parsed = parse_proposal_excel(io.BytesIO(uploaded_prop.getvalue()))
 
                 # Show detected structure
                 structure = parsed["structure"]
@@ -192,7 +316,7 @@ def render_carteira_atual():
                             if not cat_summary.empty:
                                 st.markdown("**Resumo por Categoria:**")
                                 st.dataframe(
-                                    cat_summary[["categoria", "saldo_atual", "proposta_valor", "pct_atual", "proposta_pct", "delta_pct", "num_ativos"]].rename(columns={
+                                    cat_summary.astype({"categoria": "category"})[["categoria", "saldo_atual", "proposta_valor", "pct_atual", "proposta_pct", "delta_pct", "num_ativos"]].rename(columns={
                                         "categoria": "Categoria", "saldo_atual": "Atual R$",
                                         "proposta_valor": "Proposta R$", "pct_atual": "% Atual",
                                         "proposta_pct": "% Proposta", "delta_pct": "Delta %",
@@ -231,7 +355,7 @@ def render_carteira_atual():
         # Init or load existing data
         if prospect.get("carteira_dados"):
             try:
-                existing = json.loads(prospect["carteira_dados"]) if isinstance(prospect["carteira_dados"], str) else prospect["carteira_dados"]
+                existing = json_loads(prospect["carteira_dados"]) if isinstance(prospect["carteira_dados"], str) else prospect["carteira_dados"]
                 default_df = pd.DataFrame(existing)
             except Exception:
                 default_df = pd.DataFrame(columns=["Código", "Ativo", "Financeiro", "Estratégia"])
@@ -262,10 +386,10 @@ def render_carteira_atual():
 
     # ── Save & Analyze ──
     if carteira_df is not None and not carteira_df.empty:
-        # Save to database
-        update_prospect(prospect["id"], {
-            "carteira_dados": json.dumps(carteira_df.to_dict(orient="records"), ensure_ascii=False, default=str),
-        })
+        # Save to database (skipped when the stored carteira is identical)
+        carteira_json = json_dumps(carteira_df.to_dict(orient="records"), default=str)
+        if carteira_json != prospect.get("carteira_dados"):
+            update_prospect(prospect["id"], {"carteira_dados": carteira_json})
 
         # Store in session for other pages
         st.session_state["current_prospect_carteira"] = carteira_df
@@ -275,7 +399,7 @@ def render_carteira_atual():
         st.subheader("Diagnóstico da Carteira")
 
         liquid_df = load_liquidation_data()
-        diag = _compute_diagnostico(carteira_df, liquid_df)
+        diag, carteira_pct = _session_diagnostico(carteira_df, liquid_df)
 
         if diag:
             # ── Metrics ──
@@ -294,82 +418,36 @@ def render_carteira_atual():
             st.markdown("---")
 
             # ── Charts ──
+            fig_cats, fig_liq = _diagnostic_figures(diag)
             col_chart1, col_chart2 = st.columns(2)
 
             with col_chart1:
                 st.markdown(f"**Alocação por Estratégia**")
-                cats = diag["categorias"]
-                if cats:
-                    fig = go.Figure(
-                        go.Pie(
-                            labels=list(cats.keys()),
-                            values=list(cats.values()),
-                            hole=0.55,
-                            textinfo="label+percent",
-                            textposition="outside",
-                            textfont=dict(size=11, color=TAG["offwhite"]),
-                            marker=dict(
-                                colors=TAG["chart"],
-                                line=dict(color=TAG["bg_dark"], width=1.5),
-                            ),
-                            hovertemplate="<b>%{label}</b><br>%{value:.1f}%<extra></extra>",
-                        )
-                    )
-                    fig.update_layout(**PLOTLY_LAYOUT, height=380, showlegend=False)
-                    st.plotly_chart(fig, use_container_width=True)
+                if fig_cats is not None:
+                    st.plotly_chart(fig_cats, use_container_width=True)
 
             with col_chart2:
                 st.markdown(f"**Perfil de Liquidez**")
-                buckets = diag["liq_buckets"]
-                bucket_names = list(buckets.keys())
-                bucket_vals = list(buckets.values())
-                colors = [TAG["verde"], TAG["azul"], TAG["amarelo"], TAG["rosa"]]
-
-                fig = go.Figure(
-                    go.Bar(
-                        x=bucket_vals,
-                        y=bucket_names,
-                        orientation="h",
-                        marker_color=colors[:len(bucket_names)],
-                        text=[f"{v:.1f}%" for v in bucket_vals],
-                        textposition="auto",
-                        textfont=dict(color=TAG["offwhite"]),
-                    )
-                )
-                fig.update_layout(**PLOTLY_LAYOUT, height=380, showlegend=False)
-                fig.update_xaxes(title_text="% do PL")
-                st.plotly_chart(fig, use_container_width=True)
+                st.plotly_chart(fig_liq, use_container_width=True)
 
             # ── Table ──
             st.markdown("---")
             st.markdown("**Detalhamento da Carteira**")
-            display_df = carteira_df.copy()
-            total = display_df["Financeiro"].sum()
-            display_df["% PL"] = display_df["Financeiro"] / total * 100
-            display_df = display_df.sort_values("Financeiro", ascending=False).reset_index(drop=True)
+            display_df = _with_categories(
+                carteira_pct.sort_values("Financeiro", ascending=False).reset_index(drop=True)
+            )
 
             st.dataframe(
-                display_df.style.format({
-                    "Financeiro": "R$ {:,.2f}",
-                    "% PL": "{:.2f}%",
-                }),
+                display_df,
                 use_container_width=True,
                 height=400,
+                column_config=_DISPLAY_COLUMN_CONFIG,
             )
 
-            # Save diagnostic data
-            update_prospect(prospect["id"], {
-                "carteira_dados": json.dumps(
-                    carteira_df.to_dict(orient="records"),
-                    ensure_ascii=False,
-                    default=str,
-                ),
-            })
-
     elif prospect.get("carteira_dados"):
         # Load existing carteira from DB
         try:
-            existing = json.loads(prospect["carteira_dados"]) if isinstance(prospect["carteira_dados"], str) else prospect["carteira_dados"]
+            existing = json_loads(prospect["carteira_dados"]) if isinstance(prospect["carteira_dados"], str) else prospect["carteira_dados"]
             carteira_df = pd.DataFrame(existing)
             if not carteira_df.empty:
                 st.session_state["current_prospect_carteira"] = carteira_df
@@ -378,7 +456,7 @@ def render_carteira_atual():
                 st.info("Usando carteira salva anteriormente. Faça upload de um novo arquivo para atualizar.")
 
                 liquid_df = load_liquidation_data()
-                diag = _compute_diagnostico(carteira_df, liquid_df)
+                diag, _ = _session_diagnostico(carteira_df, liquid_df)
 
                 if diag:
                     col1, col2, col3, col4 = st.columns(4)
@@ -392,8 +470,9 @@ def render_carteira_atual():
                         st.metric("Liquidez D+0-1", f"{diag['liq_buckets']['D+0-1']:.1f}%")
 
                     st.dataframe(
-                        carteira_df.style.format({"Financeiro": "R$ {:,.2f}"} if "Financeiro" in carteira_df.columns else {}),
+                        _with_categories(carteira_df),
                         use_container_width=True,
+                        column_config=_DISPLAY_COLUMN_CONFIG,
                     )
         except Exception:
             pass
@@ -3,23 +3,24 @@ Tela 3: Proposta com IA
 AI-powered proposal generation with model selection and restriction application.
 Supports rich model portfolios with asset classes, subcategories, and min/max bands.
 """
-import json
+import copy
+import hashlib
 import os
+from functools import lru_cache
 
+import numpy as np
 import pandas as pd
-import plotly.graph_objects as go
 import streamlit as st
 
 from shared.brand import TAG, PLOTLY_LAYOUT, fmt_brl, fmt_pct, render_step_indicator
 from shared.fund_utils import load_liquidation_data
 from shared.portfolio_utils import parse_model_portfolio
+from database.db import json_dumps, json_loads
 from database.models import (
     list_prospects, get_prospect, create_proposta, update_proposta,
     get_proposta, list_propostas,
 )
 from ai.client import is_ai_available, render_api_key_input
-from ai.diagnostico import generate_diagnostico
-from ai.recomendacao import generate_recomendacao, generate_texto_recomendacao
 
 
 MODELOS_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "modelos_carteira")
@@ -33,21 +34,42 @@ PERFIL_FILE_MAP = {
     "Renda Fixa": "renda_fixa",
 }
 
+# Perfil -> model name as shown by _load_modelos_disponiveis
+PERFIL_DISPLAY_MAP = {k: v.replace("_", " ").title() for k, v in PERFIL_FILE_MAP.items()}
+
+# Shared layout of the comparison donuts (title added per chart)
+_DONUT_LAYOUT = {**PLOTLY_LAYOUT, "height": 380, "showlegend": False}
+
+
+def _modelos_signature():
+    """(filename, mtime) of every model file, used as the cache key below."""
+    if not os.path.isdir(MODELOS_DIR):
+        return ()
+    with os.scandir(MODELOS_DIR) as entries:
+        return tuple(sorted(
+            (e.name, e.stat().st_mtime)
+            for e in entries
+            if e.name.endswith((".xlsx", ".xls")) and not e.name.startswith("_")  # skip master file
+        ))
+
 
 def _load_modelos_disponiveis():
     """Load available model portfolios from files.
-    Returns dict: {nome: {df: DataFrame, records: list, is_rich: bool}}
+    Returns dict: {nome: {df: DataFrame, is_rich: bool, filename: str,
+    nome_lower: str}}; records are derived from df where needed.
     """
-    modelos = {}
-    if not os.path.exists(MODELOS_DIR):
-        return modelos
+    return _load_modelos(_modelos_signature())
 
-    for f in os.listdir(MODELOS_DIR):
-        if not f.endswith((".xlsx", ".xls")):
-            continue
-        if f.startswith("_"):  # skip master file
-            continue
 
+@st.cache_data(show_spinner=False)
+def _load_modelos(signature):
+    """Parse the model files listed in ``signature``.
+
+    Keyed on file names and mtimes, so reruns reuse the parsed models until
+    a file is added, removed or rewritten.
+    """
+    modelos = {}
+    for f, _mtime in signature:
         nome = os.path.splitext(f)[0].replace("_", " ").title()
         path = os.path.join(MODELOS_DIR, f)
         try:
@@ -55,9 +77,9 @@ def _load_modelos_disponiveis():
             is_rich = "Classe" in df.columns
             modelos[nome] = {
                 "df": df,
-                "records": df.to_dict(orient="records"),
                 "is_rich": is_rich,
                 "filename": f,
+                "nome_lower": nome.lower(),
             }
         except Exception:
             pass
@@ -65,26 +87,36 @@ def _load_modelos_disponiveis():
     return modelos
 
 
+@st.cache_data(show_spinner=False, max_entries=16)
+def _parse_uploaded_model(data, name):
+    """parse_model_portfolio for an uploaded file, cached on its bytes.
+
+    ``name`` only labels the cache entry.
+    """
+    import io
+
+    return parse_model_portfolio(io.BytesIO(data))
+
+
 def _render_modelo_rico(df):
     """Render a rich model portfolio with classes and bands as a styled table."""
     if df.empty:
         return
 
-    # Group by Classe for a more visual display
-    display_df = df.copy()
-
     # Format columns
     col_config = {
         "% Alvo": st.column_config.NumberColumn("% Alvo", format="%.1f%%"),
     }
-    if "Min %" in display_df.columns:
+    if "Min %" in df.columns:
         col_config["Min %"] = st.column_config.NumberColumn("Min", format="%.0f%%")
-    if "Max %" in display_df.columns:
+    if "Max %" in df.columns:
         col_config["Max %"] = st.column_config.NumberColumn("Max", format="%.0f%%")
 
-    # Remove Codigo if empty
-    if "Codigo" in display_df.columns and (display_df["Codigo"] == "").all():
-        display_df = display_df.drop(columns=["Codigo"])
+    # Remove Codigo if empty (drop returns a new frame; df is never mutated,
+    # so no defensive copy is needed otherwise)
+    display_df = df
+    if "Codigo" in df.columns and (df["Codigo"] == "").all():
+        display_df = df.drop(columns=["Codigo"])
 
     st.dataframe(
         display_df,
@@ -104,21 +136,101 @@ def _suggest_modelo_for_perfil(modelos, perfil):
     if not perfil or not modelos:
         return None
 
-    perfil_key = PERFIL_FILE_MAP.get(perfil, "").replace("_", " ").title()
+    perfil_key = PERFIL_DISPLAY_MAP.get(perfil, "")
     if perfil_key in modelos:
         return perfil_key
 
-    # Fuzzy match
+    # Fuzzy match on the names lowered at load time
     perfil_lower = perfil.lower()
-    for nome in modelos:
-        if perfil_lower in nome.lower():
-            return nome
+    return next(
+        (nome for nome, info in modelos.items() if perfil_lower in info["nome_lower"]),
+        None,
+    )
+
+
+# (key, capitalized alias, default) of the proposed-portfolio item fields
+_PROPOSTA_KEYS = (("ativo", "Ativo", ""), ("pct_alvo", "% Alvo", 0), ("classe", "Classe", ""))
+
+
+def _normalize_proposta_keys(items):
+    """Make every item expose ativo / pct_alvo / classe, in place.
+
+    Capitalized model keys (Ativo, % Alvo, Classe) are renamed so the
+    editor does not show both spellings as separate columns.
+    """
+    for item in items:
+        for key, alias, default in _PROPOSTA_KEYS:
+            if alias in item:
+                item.setdefault(key, item.pop(alias))
+            else:
+                item.setdefault(key, default)
+    return items
+
+
+def _coerce_json(value, default):
+    """Decode ``value`` if it is a JSON string; pass other values through.
+
+    Returns ``default`` for None and for strings that are not valid JSON.
+    """
+    if not isinstance(value, str):
+        return default if value is None else value
+    try:
+        return json_loads(value)
+    except Exception:
+        return default
+
+
+def _ai_inputs_key(*inputs):
+    """Digest of the inputs of one proposal generation (JSON-encoded)."""
+    payload = json_dumps(list(inputs), default=str).encode("utf-8")
+    return hashlib.blake2b(payload, digest_size=16).hexdigest()
+
+
+def _pct_value(value):
+    """pct_alvo as a float; 0.0 when missing or not numeric (e.g. None from the AI)."""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+# Prefixes of the placeholder strings ask_claude returns instead of raising
+_AI_ERROR_PREFIXES = ("[Erro na IA", "[IA não")
 
-    return None
+
+def _is_ai_error(text):
+    """True for ask_claude's error/unavailable placeholders."""
+    return isinstance(text, str) and text.startswith(_AI_ERROR_PREFIXES)
+
+
+@lru_cache(maxsize=4096)
+def _catalog_cached(name):
+    """match_fund_catalog memoized per asset name (the catalog is static).
+
+    Callers must treat the returned entry as read-only.
+    """
+    from shared.fund_catalog import match_fund_catalog
+    return match_fund_catalog(name)
+
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def _donut_series(records):
+    """(labels, % of total) for a donut from (Ativo, Financeiro) pairs.
+
+    Cached on the pairs; missing/NaN amounts count as 0 and ([], []) is
+    returned when the total is not positive.
+    """
+    fins = [float(fin) if fin is not None and fin == fin else 0.0 for _, fin in records]
+    total = sum(fins)
+    if not total > 0:
+        return [], []
+    return [str(a)[:25] for a, _ in records], [fin / total * 100 for fin in fins]
 
 
 def _build_donut_chart(labels, values, title=""):
     """Create a consistent donut chart."""
+    import plotly.graph_objects as go
+
     fig = go.Figure(go.Pie(
         labels=labels,
         values=values,
@@ -131,12 +243,12 @@ def _build_donut_chart(labels, values, title=""):
             line=dict(color=TAG["bg_dark"], width=1),
         ),
     ))
-    layout = dict(PLOTLY_LAYOUT)
-    layout["height"] = 380
-    layout["showlegend"] = False
     if title:
-        layout["title"] = dict(text=title, font=dict(color=TAG["offwhite"], size=14))
-    fig.update_layout(**layout)
+        fig.update_layout(
+            **_DONUT_LAYOUT, title=dict(text=title, font=dict(color=TAG["offwhite"], size=14)),
+        )
+    else:
+        fig.update_layout(**_DONUT_LAYOUT)
     return fig
 
 
@@ -147,7 +259,7 @@ def render_proposta_ia():
     render_api_key_input()
 
     # ── Select prospect ──
-    prospects = list_prospects()
+    prospects = list_prospects(columns=("id", "nome", "perfil_investidor", "carteira_dados"))
     if not prospects:
         st.warning("Nenhum prospect cadastrado. Va para 'Cadastro' primeiro.")
         return
@@ -162,10 +274,16 @@ def render_proposta_ia():
     sel_idx = st.selectbox("Selecionar prospect", range(len(names)), format_func=lambda i: names[i])
     prospect = get_prospect(prospects_with_data[sel_idx]["id"])
 
-    # Load carteira
-    try:
-        carteira_data = json.loads(prospect["carteira_dados"]) if isinstance(prospect["carteira_dados"], str) else prospect["carteira_dados"]
-    except Exception:
+    # Load carteira (the parsed list is reused while the stored JSON is unchanged)
+    raw_carteira = prospect["carteira_dados"]
+    carteira_key = (prospect["id"], hash(raw_carteira) if isinstance(raw_carteira, str) else None)
+    cached_carteira = st.session_state.get("_carteira_cache")
+    if cached_carteira is not None and carteira_key[1] is not None and cached_carteira[0] == carteira_key:
+        carteira_data = cached_carteira[1]
+    else:
+        carteira_data = _coerce_json(raw_carteira, None)
+        st.session_state["_carteira_cache"] = (carteira_key, carteira_data)
+    if carteira_data is None:
         st.error("Erro ao carregar carteira do prospect.")
         return
 
@@ -190,11 +308,7 @@ def render_proposta_ia():
 
     # Show restrictions
     restricoes = prospect.get("restricoes", [])
-    if isinstance(restricoes, str):
-        try:
-            restricoes = json.loads(restricoes)
-        except Exception:
-            restricoes = [restricoes] if restricoes else []
+    restricoes = _coerce_json(restricoes, [restricoes] if restricoes else [])
 
     if restricoes:
         restricoes_str = ", ".join(restricoes) if isinstance(restricoes, list) else str(restricoes)
@@ -202,12 +316,7 @@ def render_proposta_ia():
     if prospect.get("restricoes_texto"):
         st.markdown(f"**Restricoes adicionais:** {prospect['restricoes_texto']}")
     if prospect.get("objetivos"):
-        obj = prospect["objetivos"]
-        if isinstance(obj, str):
-            try:
-                obj = json.loads(obj)
-            except Exception:
-                obj = [obj]
+        obj = _coerce_json(prospect["objetivos"], [prospect["objetivos"]])
         if obj:
             st.markdown(f"**Objetivos:** {', '.join(obj) if isinstance(obj, list) else obj}")
 
@@ -256,7 +365,7 @@ def render_proposta_ia():
                     hide_index=True,
                 )
 
-            modelo_base = modelo_info["records"]
+            modelo_base = modelo_info["df"].to_dict(orient="records")
         else:
             st.info(f"Nenhum modelo encontrado em `modelos_carteira/`. Faca upload ou use modelo manual.")
 
@@ -268,7 +377,7 @@ def render_proposta_ia():
         )
         if uploaded_model:
             try:
-                model_df = parse_model_portfolio(uploaded_model)
+                model_df = _parse_uploaded_model(uploaded_model.getvalue(), uploaded_model.name)
                 modelo_base = model_df.to_dict(orient="records")
                 modelo_nome = uploaded_model.name
                 if "Classe" in model_df.columns:
@@ -319,27 +428,61 @@ def render_proposta_ia():
 
             # Generate diagnostic
             from pages_proposta.p2_carteira_atual import _compute_diagnostico
+            from ai.diagnostico import generate_diagnostico
+            from ai.recomendacao import generate_recomendacao, generate_texto_recomendacao
             liquid_df = load_liquidation_data()
             carteira_df = pd.DataFrame(carteira_data)
             diag_metricas = _compute_diagnostico(carteira_df, liquid_df)
 
-            diagnostico_texto = generate_diagnostico(prospect, carteira_data, diag_metricas)
+            # The AI texts only depend on these inputs: a repeated click with
+            # the same prospect, model and carteira reuses the last answers
+            # instead of paying for the calls again.
+            # Only complete AI answers are stored, and the cached objects are
+            # deep-copied on the way out since the enrichment below mutates them.
+            ai_key = _ai_inputs_key(prospect, modelo_nome, modelo_base, carteira_data, ai_available)
+            ai_cached = st.session_state.get("_ai_cache")
+            ai_cached = ai_cached[1] if ai_cached is not None and ai_cached[0] == ai_key else None
+            ai_failures = [] if ai_available else ["ai_indisponivel"]
+
+            if ai_cached is not None:
+                diagnostico_texto, recomendacao, rec_texto, _ = ai_cached
+                recomendacao = copy.deepcopy(recomendacao)
+            else:
+                diagnostico_texto = generate_diagnostico(prospect, carteira_data, diag_metricas)
 
-            # Generate recommendation (pass rich model data)
-            recomendacao = generate_recomendacao(prospect, carteira_data, modelo_base)
+                # Generate recommendation (pass rich model data)
+                recomendacao = generate_recomendacao(
+                    prospect, carteira_data, modelo_base, failures=ai_failures)
 
-            # Generate recommendation text
-            rec_texto = generate_texto_recomendacao(prospect, recomendacao, diagnostico_texto)
+                # Generate recommendation text
+                rec_texto = generate_texto_recomendacao(prospect, recomendacao, diagnostico_texto)
+                recomendacao_snapshot = copy.deepcopy(recomendacao)
+                if _is_ai_error(diagnostico_texto) or _is_ai_error(rec_texto):
+                    ai_failures.append("texto")
 
-            carteira_proposta = recomendacao.get("carteira_proposta", [])
+            # Malformed AI output (null list, non-dict items) must not abort
+            # the save: only dict items are kept for enrichment.
+            carteira_proposta = _normalize_proposta_keys([
+                item for item in (recomendacao.get("carteira_proposta") or [])
+                if isinstance(item, dict)
+            ])
 
             # ── Enrich proposed portfolio with fund catalog + R$ values ──
+            # and build the fund cards in the same pass
             patrimonio = float(prospect.get("patrimonio_investivel", 0))
-            try:
-                from shared.fund_catalog import match_fund_catalog
-                for item in carteira_proposta:
-                    name = item.get("ativo", item.get("Ativo", ""))
-                    catalog = match_fund_catalog(name)
+            fundos_sugeridos = []
+            # R$ value of every asset in one array pass; a missing or
+            # non-numeric pct_alvo counts as 0 instead of failing the batch
+            pcts = np.fromiter(
+                (_pct_value(item["pct_alvo"]) for item in carteira_proposta),
+                dtype=np.float64, count=len(carteira_proposta),
+            )
+            valores_rs = np.round(pcts * patrimonio / 100, 2).tolist()
+
+            for item, pct, valor_rs in zip(carteira_proposta, pcts.tolist(), valores_rs):
+                try:
+                    name = item["ativo"]
+                    catalog = _catalog_cached(name)
                     if catalog:
                         item.setdefault("instituicao", catalog.get("gestor", ""))
                         item.setdefault("resgate", catalog.get("resgate", ""))
@@ -352,30 +495,21 @@ def render_proposta_ia():
                         item.setdefault("subtipo_fundo", catalog.get("subtipo", ""))
                         item.setdefault("estrategia_descricao", catalog.get("estrategia", ""))
 
-                    # Calculate R$ value
-                    pct = float(item.get("pct_alvo", item.get("% Alvo", 0)))
+                    # R$ value
                     if patrimonio > 0 and pct > 0:
-                        item["proposta_rs"] = round(patrimonio * pct / 100, 2)
+                        item["proposta_rs"] = valor_rs
                     else:
                         item.setdefault("proposta_rs", 0)
 
                     # Default action
                     item.setdefault("acao_recomendada", "Aplicar")
-            except Exception:
-                pass
 
-            # ── Build fund cards data from catalog ──
-            fundos_sugeridos = []
-            try:
-                from shared.fund_catalog import match_fund_catalog as _mfc
-                for item in carteira_proposta:
-                    name = item.get("ativo", item.get("Ativo", ""))
-                    catalog = _mfc(name)
+                    # Fund card
                     card = {
                         "nome": name,
-                        "pct_alvo": item.get("pct_alvo", item.get("% Alvo", 0)),
-                        "proposta_rs": item.get("proposta_rs", 0),
-                        "classe": item.get("classe", item.get("Classe", "")),
+                        "pct_alvo": item["pct_alvo"],
+                        "proposta_rs": item["proposta_rs"],
+                        "classe": item["classe"],
                     }
                     if catalog:
                         card.update({
@@ -392,8 +526,8 @@ def render_proposta_ia():
                             "isento_ir": catalog.get("isento_ir", False),
                         })
                     fundos_sugeridos.append(card)
-            except Exception:
-                pass
+                except Exception:
+                    continue  # skip an item the catalog/enrichment chokes on
 
             # ── Build proposta comercial from prospect fee data ──
             fee_data = prospect.get("fee_negociada", {})
@@ -444,13 +578,22 @@ def render_proposta_ia():
                 pass
 
             # Generate AI section texts (now includes batches 4-6)
-            try:
-                from ai.sections import generate_all_section_texts
-                section_texts = generate_all_section_texts(
-                    prospect, carteira_data, carteira_proposta,
-                    diagnostico_texto, rec_texto, analytics, modelo_base)
-            except Exception:
-                pass
+            if ai_cached is not None:
+                section_texts = copy.deepcopy(ai_cached[3])
+            else:
+                try:
+                    from ai.sections import generate_all_section_texts
+                    section_texts = generate_all_section_texts(
+                        prospect, carteira_data, carteira_proposta,
+                        diagnostico_texto, rec_texto, analytics, modelo_base,
+                        failures=ai_failures)
+                except Exception:
+                    ai_failures.append("sections")
+                if not ai_failures:
+                    st.session_state["_ai_cache"] = (
+                        ai_key,
+                        (diagnostico_texto, recomendacao_snapshot, rec_texto, section_texts),
+                    )
 
             # ── Build politica_investimentos from section texts ──
             politica_investimentos = {
@@ -494,7 +637,7 @@ def render_proposta_ia():
     proposta_id = st.session_state.get("current_proposta_id")
     if not proposta_id:
         # Check for existing propostas
-        existing = list_propostas(prospect["id"])
+        existing = list_propostas(prospect["id"], columns=("id", "versao", "status", "created_at"))
         if existing:
             st.markdown("---")
             st.subheader("Propostas Existentes")
@@ -533,13 +676,9 @@ def render_proposta_ia():
         )
 
     # Proposed portfolio
+    edited_prop = None
     with st.expander("Carteira Proposta", expanded=True):
-        cart_prop = proposta.get("carteira_proposta", [])
-        if isinstance(cart_prop, str):
-            try:
-                cart_prop = json.loads(cart_prop)
-            except Exception:
-                cart_prop = []
+        cart_prop = _coerce_json(proposta.get("carteira_proposta", []), [])
 
         if cart_prop:
             prop_df = pd.DataFrame(cart_prop)
@@ -573,31 +712,24 @@ def render_proposta_ia():
             col1, col2 = st.columns(2)
 
             with col1:
-                if carteira_data:
-                    cart_df = pd.DataFrame(carteira_data)
-                    if "Financeiro" in cart_df.columns:
-                        total = cart_df["Financeiro"].sum()
-                        if total > 0:
-                            cart_df["pct"] = cart_df["Financeiro"] / total * 100
-                            fig = _build_donut_chart(
-                                cart_df["Ativo"].str[:25].tolist(),
-                                cart_df["pct"].tolist(),
-                                "Carteira Atual",
-                            )
-                            st.plotly_chart(fig, use_container_width=True)
+                if carteira_data and any("Financeiro" in d for d in carteira_data):
+                    labels, values = _donut_series(tuple(
+                        (d.get("Ativo", ""), d.get("Financeiro")) for d in carteira_data
+                    ))
+                    if labels:
+                        fig = _build_donut_chart(labels, values, "Carteira Atual")
+                        st.plotly_chart(fig, use_container_width=True)
 
             with col2:
                 # Build donut from proposed
-                prop_labels = []
-                prop_values = []
-                for item in cart_prop:
-                    name = item.get("ativo", item.get("Ativo", ""))[:25]
-                    pct = item.get("pct_alvo", item.get("% Alvo", 0))
-                    if pct > 0:
-                        prop_labels.append(name)
-                        prop_values.append(pct)
-
-                if prop_labels:
+                prop_pairs = [
+                    (item.get("ativo", item.get("Ativo", ""))[:25], pct)
+                    for item in cart_prop
+                    if (pct := item.get("pct_alvo", item.get("% Alvo", 0))) > 0
+                ]
+
+                if prop_pairs:
+                    prop_labels, prop_values = map(list, zip(*prop_pairs))
                     fig = _build_donut_chart(prop_labels, prop_values, "Carteira Proposta TAG")
                     st.plotly_chart(fig, use_container_width=True)
         else:
@@ -612,7 +744,7 @@ def render_proposta_ia():
                 "recomendacao_texto": rec_texto,
                 "status": "Rascunho",
             }
-            if cart_prop and "edited_prop" in dir():
+            if cart_prop and edited_prop is not None:
                 update_data["carteira_proposta"] = edited_prop.to_dict(orient="records")
             update_proposta(proposta_id, update_data)
             st.success("Rascunho salvo!")
@@ -19,6 +19,7 @@ import streamlit as st
 import pandas as pd
 
 from shared.brand import TAG, PLOTLY_LAYOUT, fmt_brl, fmt_pct
+from database.db import json_loads
 from database.models import (
     list_prospects, get_prospect, list_propostas, get_proposta,
     update_proposta,
@@ -33,38 +34,33 @@ from proposal_gen.charts import (
 from proposal_gen.html_generator import generate_proposal_html, save_proposal_html
 
 
-def render_visualizar():
-    st.title("Visualizar Proposta")
+@st.cache_data(show_spinner=False, max_entries=32)
+def _cached_prospect(prospect_id, updated_at):
+    """get_prospect memoized on (id, updated_at); every update bumps updated_at."""
+    return get_prospect(prospect_id)
 
-    # ── Select prospect & proposta ──
-    prospects = list_prospects()
-    if not prospects:
-        st.warning("Nenhum prospect cadastrado.")
-        return
 
-    names = [f"{p['nome']} ({p['status']})" for p in prospects]
-    sel_idx = st.selectbox("Prospect", range(len(names)), format_func=lambda i: names[i])
-    prospect = get_prospect(prospects[sel_idx]["id"])
+@st.cache_data(show_spinner=False, max_entries=32)
+def _cached_proposta(proposta_id, updated_at):
+    """get_proposta memoized on (id, updated_at), like _cached_prospect."""
+    return get_proposta(proposta_id)
 
-    propostas = list_propostas(prospect["id"])
-    if not propostas:
-        st.info("Nenhuma proposta criada para este prospect. Va para 'Proposta com IA'.")
-        return
 
-    prop_names = [f"v{p.get('versao', '?')} - {p.get('status', '')} ({p.get('created_at', '')[:10]})" for p in propostas]
-    prop_idx = st.selectbox("Versao da proposta", range(len(prop_names)), format_func=lambda i: prop_names[i])
-    proposta = get_proposta(propostas[prop_idx]["id"])
+@st.cache_data(show_spinner=False, max_entries=32)
+def _parse_carteira(raw):
+    """Decode a stored carteira_dados JSON string (cached on its contents)."""
+    return json_loads(raw)
 
-    if not proposta:
-        st.error("Proposta nao encontrada.")
-        return
 
-    st.markdown("---")
+# st.fragment (Streamlit >= 1.37; experimental_fragment since 1.33) reruns only
+# the decorated function when one of its own widgets is used, so the proposal
+# charts are not rebuilt. Older versions simply run the function inline.
+_fragment = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", None) or (lambda fn: fn)
 
-    # ── Scoring Badge ──
-    _render_scoring_badge(prospect, proposta)
 
-    # ── Actions bar ──
+@_fragment
+def _render_actions_bar(prospect, proposta):
+    """Gerar HTML / Baixar HTML / Marcar como Enviada / status."""
     col1, col2, col3, col4 = st.columns(4)
     with col1:
         if st.button("Gerar HTML", type="primary", use_container_width=True):
@@ -102,6 +98,43 @@ def render_visualizar():
             unsafe_allow_html=True,
         )
 
+
+def render_visualizar():
+    st.title("Visualizar Proposta")
+
+    # ── Select prospect & proposta ──
+    # The lists are cheap and always fresh; their updated_at keys the
+    # cached full-row fetches below, so edits are picked up immediately.
+    prospects = list_prospects(columns=("id", "nome", "status", "updated_at"))
+    if not prospects:
+        st.warning("Nenhum prospect cadastrado.")
+        return
+
+    names = [f"{p['nome']} ({p['status']})" for p in prospects]
+    sel_idx = st.selectbox("Prospect", range(len(names)), format_func=lambda i: names[i])
+    prospect = _cached_prospect(prospects[sel_idx]["id"], prospects[sel_idx]["updated_at"])
+
+    propostas = list_propostas(prospect["id"], columns=("id", "versao", "status", "created_at", "updated_at"))
+    if not propostas:
+        st.info("Nenhuma proposta criada para este prospect. Va para 'Proposta com IA'.")
+        return
+
+    prop_names = [f"v{p.get('versao', '?')} - {p.get('status', '')} ({p.get('created_at', '')[:10]})" for p in propostas]
+    prop_idx = st.selectbox("Versao da proposta", range(len(prop_names)), format_func=lambda i: prop_names[i])
+    proposta = _cached_proposta(propostas[prop_idx]["id"], propostas[prop_idx]["updated_at"])
+
+    if not proposta:
+        st.error("Proposta nao encontrada.")
+        return
+
+    st.markdown("---")
+
+    # ── Scoring Badge ──
+    _render_scoring_badge(prospect, proposta)
+
+    # ── Actions bar ──
+    _render_actions_bar(prospect, proposta)
+
     st.markdown("---")
 
     # ── Load proposal data ──
@@ -115,14 +148,14 @@ def render_visualizar():
     cart_prop = proposta.get("carteira_proposta", [])
     if isinstance(cart_prop, str):
         try:
-            cart_prop = json.loads(cart_prop)
+            cart_prop = json_loads(cart_prop)
         except Exception:
             cart_prop = []
 
     cart_atual = []
     if prospect.get("carteira_dados"):
         try:
-            cart_atual = json.loads(prospect["carteira_dados"]) if isinstance(prospect["carteira_dados"], str) else prospect["carteira_dados"]
+            cart_atual = _parse_carteira(prospect["carteira_dados"]) if isinstance(prospect["carteira_dados"], str) else prospect["carteira_dados"]
         except Exception:
             pass
 
@@ -1026,6 +1059,7 @@ def _render_legacy_sections(prospect, proposta, cart_prop, cart_atual):
 # BACKTEST
 # ══════════════════════════════════════════════════════════
 
+@_fragment
 def _render_backtest_section(prospect, proposta, cart_prop):
     from shared.backtest import (
         calculate_portfolio_backtest, compare_portfolios_backtest,
@@ -469,7 +469,7 @@ def _render_velocity_metrics(all_prospects, stats):
     # Prospects with proposals
     prospects_with_proposals = 0
     for p in all_prospects:
-        props = list_propostas(p["id"])
+        props = list_propostas(p["id"], columns=("id",))
         if props:
             prospects_with_proposals += 1
     prop_coverage = (prospects_with_proposals / total * 100) if total > 0 else 0
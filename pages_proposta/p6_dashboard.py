@@ -458,7 +458,7 @@ def _render_proposal_stats(all_prospects):
     total_proposals = 0
     status_counts = {}
     for p in all_prospects:
-        propostas = list_propostas(p["id"])
+        propostas = list_propostas(p["id"], columns=("id", "status"))
         total_proposals += len(propostas)
         for prop in propostas:
             status = prop.get("status", "Rascunho")
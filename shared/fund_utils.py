@@ -4,6 +4,7 @@ Fund matching, identification and liquidation data utilities.
 import os
 import re
 
+import numpy as np
 import pandas as pd
 import streamlit as st
 
@@ -93,6 +94,94 @@ def match_fund_liquidation(fund_name, fund_code, liquid_df):
     return None
 
 
+def _first_positions(keys):
+    """Map each key to the position of its first occurrence."""
+    out = {}
+    for pos, key in enumerate(keys):
+        out.setdefault(key, pos)
+    return out
+
+
+@st.cache_resource(show_spinner=False)
+def build_liquidation_lookup(liquid_df):
+    """Exact-match indexes over ``liquid_df``: (by_code, by_name) -> row position.
+
+    Same precedence as match_fund_liquidation: "Código Anbima" over
+    "Id Carteira", "Apelido" over "Nome", first row wins. Read-only.
+    """
+    by_code = _first_positions(liquid_df["Id Carteira"].astype(str))
+    by_code.update(_first_positions(liquid_df["Código Anbima"].astype(str)))
+    by_name = {}
+    for col in ("Nome", "Apelido"):
+        names = liquid_df[col].str.upper().str.strip()
+        by_name.update(_first_positions(names.where(names.notna(), None)))
+    by_name.pop(None, None)
+    return by_code, by_name
+
+
+@st.cache_resource(show_spinner=False)
+def build_fuzzy_name_index(liquid_df):
+    """Normalized "Apelido" and "Nome" columns for substring matching.
+
+    One (names, array) pair per column, in match_fund_liquidation's order:
+    the list feeds the "liquidation name in asset name" test, the unicode
+    array the vectorized "asset name in liquidation name" test. Read-only.
+    """
+    index = []
+    for col in ("Apelido", "Nome"):
+        names = liquid_df[col].astype(str).str.strip().str.upper().tolist()
+        index.append((names, np.asarray(names, dtype=str)))
+    return tuple(index)
+
+
+def _fuzzy_name_position(name_clean, fuzzy_index):
+    """Row position of the first substring match for ``name_clean``, or None.
+
+    Same rule and precedence as the fuzzy step of match_fund_liquidation.
+    """
+    for names, arr in fuzzy_index:
+        contains = np.char.find(arr, name_clean) >= 0
+        contained = np.fromiter(map(name_clean.__contains__, names), dtype=bool, count=len(names))
+        hits = np.flatnonzero(contains | contained)
+        if hits.size:
+            return int(hits[0])
+    return None
+
+
+def match_liquidation_days(codes, names, liquid_df):
+    """Total redemption days (Conversão + Liquid. Resgate) per asset.
+
+    Bulk version of match_fund_liquidation for string Series ``codes`` and
+    ``names``: exact code/name hits are resolved with dict lookups, the
+    remaining assets are matched by substring against the precomputed name
+    arrays and finally checked for a B3 ticker (D+2). Returns a float array
+    with NaN where no match was found.
+    """
+    by_code, by_name = build_liquidation_lookup(liquid_df)
+    codes = codes.reset_index(drop=True)
+    names = names.reset_index(drop=True)
+
+    pos = codes.map(by_code).where(codes != "")
+    name_pos = names.str.strip().str.upper().map(by_name).where(names != "")
+    pos = pos.fillna(name_pos)
+
+    d_liq = (liquid_df["Conversão Resgate"] + liquid_df["Liquid. Resgate"]).to_numpy(np.float64)
+    days = np.full(len(codes), np.nan)
+    hit = pos.notna().to_numpy()
+    days[hit] = d_liq[pos[hit].to_numpy(np.int64)]
+
+    fuzzy_index = build_fuzzy_name_index(liquid_df)
+    for i in np.flatnonzero(~hit):
+        name, code = names[i], codes[i]
+        name_clean = name.strip().upper()
+        p = _fuzzy_name_position(name_clean, fuzzy_index) if len(name_clean) > 5 else None
+        if p is not None:
+            days[i] = d_liq[p]
+        elif is_stock_ticker(name or code):
+            days[i] = 2
+    return days
+
+
 def identify_cash_funds(ativos_df, liquid_df):
     """Identify funds with ESTRATÉGIA containing 'CAIXA'."""
     cod_col = find_col(ativos_df, "CÓD. ATIVO", "COD. ATIVO")
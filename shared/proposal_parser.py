@@ -11,8 +11,9 @@ def detect_clients_and_sheets(filepath):
     """Auto-detect which clients and banks are in the file.
     Returns dict: {client_name: {bank_name: sheet_name, ...}, ...}
     Plus special keys for consolidated/total sheets.
+    ``filepath`` may be a path, a binary file-like or an open pd.ExcelFile.
     """
-    xl = pd.ExcelFile(filepath)
+    xl = filepath if isinstance(filepath, pd.ExcelFile) else pd.ExcelFile(filepath)
     result = {"clients": {}, "totals": [], "graficos": [], "all_sheets": xl.sheet_names}
 
     for name in xl.sheet_names:
@@ -137,9 +138,12 @@ def extract_summary_from_sheet(df):
 
 def parse_proposal_excel(filepath):
     """Parse the entire proposal file.
+    Accepts a path or a binary file-like (e.g. an upload's BytesIO).
     Returns dict with parsed data for each sheet plus metadata.
     """
-    structure = detect_clients_and_sheets(filepath)
+    # Open the workbook once; every sheet is read from the same handle
+    xl = pd.ExcelFile(filepath)
+    structure = detect_clients_and_sheets(xl)
     result = {
         "structure": structure,
         "sheets": {},
@@ -151,7 +155,7 @@ def parse_proposal_excel(filepath):
         if any(g in name.lower() for g in ["grafico", "total2"]):
             continue
         try:
-            df = parse_proposal_sheet(filepath, name)
+            df = parse_proposal_sheet(xl, name)
             if not df.empty:
                 result["sheets"][name] = {
                     "all": df,